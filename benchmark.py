@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+
+import os
+import time
+import random
+import argparse
+import tempfile
+
+from src import Database
+
+parser = argparse.ArgumentParser(description='Benchmark the tags search on synthetic databases')
+parser.add_argument('--files', type=int, nargs='+', help='number of files of each database', default=[10000, 100000, 1000000])
+parser.add_argument('--tags', type=int, help='number of tags', default=200)
+parser.add_argument('--tags-per-file', type=int, help='average number of tags of a file', default=6)
+parser.add_argument('--repeat', type=int, help='number of runs of each query', default=3)
+parser.add_argument('--seed', type=int, help='random seed', default=0)
+args = parser.parse_args()
+
+SEARCH_TAGS = [1, 2, 3, 4, 6]
+NAME_CONTAINS = [None, 'file_1']
+
+## Legacy search (INTERSECT chain)
+def legacySearch(db, tags, name_contains=None):
+  params = {}
+  if name_contains is not None:
+    params['name_contains'] = '%' + name_contains + '%'
+  query = 'SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F'
+  for tag in tags:
+    query += ' INTERSECT SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F, TagsFiles TF WHERE F.Code = TF.File AND TF.Tag = ' + str(int(tag))
+  if name_contains is not None:
+    query += ' INTERSECT SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F WHERE LOWER(F.Name) LIKE :name_contains'
+  query += ' ORDER BY F.Name'
+  db.db.execute(query, params)
+  return db.getFilesFromDBData(db.db.fetchall())
+
+## Synthetic database
+def populate(db, files_count, tags_count, tags_per_file, rnd):
+  # tags popularity follows a Zipf-like distribution
+  tags_codes = list(range(1, tags_count + 1))
+  weights = [1.0 / code for code in tags_codes]
+  db.db.executemany('INSERT INTO Tags(Code, Name, Category) VALUES (?, ?, 1)', [(code, 'tag_' + str(code)) for code in tags_codes])
+  files = []
+  tags_files = []
+  for code in range(1, files_count + 1):
+    files.append((code, 'folder_' + str(code % 100), 'file_' + str(code) + '.png', 'image/png'))
+    file_tags = set(rnd.choices(tags_codes, weights, k=rnd.randint(1, 2 * tags_per_file - 1)))
+    for tag in file_tags:
+      tags_files.append((tag, code, rnd.randint(1, 5)))
+  db.db.executemany('INSERT INTO Files(Code, Location, Name, Mime) VALUES (?, ?, ?, ?)', files)
+  db.db.executemany('INSERT INTO TagsFiles(Tag, File, Magnitude) VALUES (?, ?, ?)', tags_files)
+  db.commit()
+
+def timeSearch(method, repeat):
+  best = None
+  result = None
+  for _ in range(repeat):
+    start = time.perf_counter()
+    result = method()
+    elapsed = time.perf_counter() - start
+    if best is None or elapsed < best:
+      best = elapsed
+  return best, result
+
+def run(files_count, folder, rnd):
+  db_path = os.path.join(folder, 'bench_' + str(files_count) + '.db')
+  db = Database.start(db_path)
+  print('Populating database with ' + str(files_count) + ' files')
+  populate(db, files_count, args.tags, args.tags_per_file, rnd)
+  print('%6s %-12s %8s %12s %12s %8s' % ('tags', 'name', 'results', 'old (ms)', 'new (ms)', 'speedup'))
+  for tags_count in SEARCH_TAGS:
+    # pick among the most popular tags so that the result is not empty
+    tags = rnd.sample(range(1, min(args.tags, 3 * tags_count) + 1), tags_count)
+    for name_contains in NAME_CONTAINS:
+      old_time, old_files = timeSearch(lambda : legacySearch(db, tags, name_contains), args.repeat)
+      new_time, new_files = timeSearch(lambda : db.getFilesWithTags(tags, name_contains=name_contains), args.repeat)
+      if list(map(int, old_files)) != list(map(int, new_files)):
+        print('WARNING: different results for tags ' + str(tags))
+      print('%6d %-12s %8d %12.2f %12.2f %7.1fx' % (tags_count, str(name_contains), len(new_files), old_time * 1000, new_time * 1000, old_time / new_time))
+  db.close()
+
+rnd = random.Random(args.seed)
+with tempfile.TemporaryDirectory() as folder:
+  for files_count in args.files:
+    run(files_count, folder, rnd)
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+
+import os
+import argparse
+
+from src import Profile
+from src import Importer
+from src.Common import getConfigFolder
+
+parser = argparse.ArgumentParser(description='Add all the files of a folder (and subfolders) to the database')
+parser.add_argument('folders', nargs='*', help='folders to import (default: the root folder)')
+parser.add_argument('--profile', help='profile to use', default='default')
+parser.add_argument('--workers', type=int, help='processes used to detect the mime types', default=os.cpu_count())
+parser.add_argument('--batch-size', type=int, help='files added in each transaction', default=Importer.BATCH_SIZE)
+parser.add_argument('--update-fingerprints', action='store_true', help='compute the missing fingerprints of the known files')
+args = parser.parse_args()
+
+def printProgress(scanned, added, relinked, failed, elapsed):
+  rate = scanned / elapsed if elapsed > 0 else 0
+  print('Scanned %d files, added %d, moved %d, failed %d (%.0f files/s)' % (scanned, added, relinked, failed, rate))
+
+config_folder = getConfigFolder(args.profile)
+profile = Profile.start(config_folder)
+folders = args.folders
+if len(folders) == 0:
+  folders = [profile.config['root']]
+importer = Importer.start(profile, workers=args.workers, batch_size=args.batch_size, progress=printProgress)
+for folder in folders:
+  if not importer.isInRoot(folder):
+    print('Skipping ' + folder + ': not under the root folder ' + profile.config['root'])
+if args.update_fingerprints:
+  updated = importer.updateFingerprints()
+  print('Updated the fingerprints of %d files' % updated)
+scanned, added, relinked, failed = importer.run(folders)
+elapsed = importer.getElapsed()
+print('Done in %.1f s: scanned %d files, added %d, moved %d, failed %d' % (elapsed, scanned, added, relinked, failed))
+profile.close()
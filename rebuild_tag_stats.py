@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from src import Profile
+from src.Common import getConfigFolder
+
+parser = argparse.ArgumentParser(description='Count again the files of each tag')
+parser.add_argument('--profile', help='profile to use', default='default')
+args = parser.parse_args()
+
+config_folder = getConfigFolder(args.profile)
+profile = Profile.start(config_folder)
+profile.getDatabase().rebuildTagStats()
+print('Tags statistics rebuilt')
+profile.close()
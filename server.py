@@ -6,20 +6,23 @@ from flask import Flask
 from flask import request
 
 from src import TMWeb
+from src import TMWebPool
 
 parser = argparse.ArgumentParser(description='Tag Search Server')
 parser.add_argument('--port', type=int, help='port to use', default=44660)
 parser.add_argument('--profile', help='profile to use', default='default')
 parser.add_argument('--debug', action='store_true', help='debug mode')
+parser.add_argument('--pool-size', type=int, help='database connections per profile', default=TMWebPool.POOL_SIZE)
 
 args = parser.parse_args()
 
 profile = args.profile
 port = args.port
 debug = args.debug
+pool_size = args.pool_size
 
 app = Flask('TagSearchServer')
-aw = TMWeb.start(profile)
+aw = TMWeb.start(profile, pool_size)
 
 @app.route('/tagsearch/manager.py', methods=['GET'])
 def pass_update():
@@ -27,4 +30,4 @@ def pass_update():
   return aw.run(data)
 
 if __name__ == '__main__':
-  app.run(host='0.0.0.0', port=port, debug=debug)
+  app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
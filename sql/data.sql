@@ -12,8 +12,6 @@ CREATE TABLE Tags (
 	Category INTEGER
 );
 
-/*CREATE INDEX 'TagsName' ON Tags(Name);*/
-
 CREATE TABLE Files (
 	Code INTEGER PRIMARY KEY,
 	Location TEXT,
@@ -0,0 +1,8 @@
+/* Per-file lookups (tags of a file, file deletion, untagged files) */
+CREATE INDEX IF NOT EXISTS TagsFilesFile ON TagsFiles(File, Tag, Magnitude);
+
+CREATE INDEX IF NOT EXISTS FilesName ON Files(Name);
+
+CREATE INDEX IF NOT EXISTS TagsCategory ON Tags(Category);
+
+/* NOTE: Tags(Name) is UNIQUE and so already indexed */
@@ -0,0 +1,19 @@
+/* Trigram full-text index of the files names and locations (name_contains searches) */
+CREATE VIRTUAL TABLE IF NOT EXISTS FilesNames USING fts5(Name, Location, content='Files', content_rowid='Code', tokenize='trigram');
+
+/* Keep the index in sync with Files */
+CREATE TRIGGER IF NOT EXISTS FilesNamesInsert AFTER INSERT ON Files BEGIN
+  INSERT INTO FilesNames(rowid, Name, Location) VALUES (new.Code, new.Name, new.Location);
+END;
+
+CREATE TRIGGER IF NOT EXISTS FilesNamesDelete AFTER DELETE ON Files BEGIN
+  INSERT INTO FilesNames(FilesNames, rowid, Name, Location) VALUES ('delete', old.Code, old.Name, old.Location);
+END;
+
+CREATE TRIGGER IF NOT EXISTS FilesNamesUpdate AFTER UPDATE OF Name, Location ON Files BEGIN
+  INSERT INTO FilesNames(FilesNames, rowid, Name, Location) VALUES ('delete', old.Code, old.Name, old.Location);
+  INSERT INTO FilesNames(rowid, Name, Location) VALUES (new.Code, new.Name, new.Location);
+END;
+
+/* Index the existing files */
+INSERT INTO FilesNames(FilesNames) VALUES ('rebuild');
@@ -0,0 +1,4 @@
+/* Content fingerprint of the files (size and hash of the first and last blocks) to find the moved files */
+ALTER TABLE Files ADD COLUMN Fingerprint TEXT;
+
+CREATE INDEX IF NOT EXISTS FilesFingerprint ON Files(Fingerprint);
@@ -0,0 +1,29 @@
+/* Number of files and sum of the magnitudes of each tag (query planning, tags counts) */
+CREATE TABLE IF NOT EXISTS TagStats (
+  Tag INTEGER PRIMARY KEY,
+  Files INTEGER NOT NULL DEFAULT 0,
+  MagnitudeSum INTEGER NOT NULL DEFAULT 0
+);
+
+/* Keep the statistics in sync with TagsFiles */
+CREATE TRIGGER IF NOT EXISTS TagStatsInsert AFTER INSERT ON TagsFiles BEGIN
+  INSERT INTO TagStats(Tag, Files, MagnitudeSum) VALUES (new.Tag, 1, IFNULL(new.Magnitude, 0))
+    ON CONFLICT(Tag) DO UPDATE SET Files = Files + 1, MagnitudeSum = MagnitudeSum + excluded.MagnitudeSum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS TagStatsDelete AFTER DELETE ON TagsFiles BEGIN
+  UPDATE TagStats SET Files = Files - 1, MagnitudeSum = MagnitudeSum - IFNULL(old.Magnitude, 0) WHERE Tag = old.Tag;
+END;
+
+CREATE TRIGGER IF NOT EXISTS TagStatsUpdate AFTER UPDATE OF Tag, Magnitude ON TagsFiles BEGIN
+  UPDATE TagStats SET Files = Files - 1, MagnitudeSum = MagnitudeSum - IFNULL(old.Magnitude, 0) WHERE Tag = old.Tag;
+  INSERT INTO TagStats(Tag, Files, MagnitudeSum) VALUES (new.Tag, 1, IFNULL(new.Magnitude, 0))
+    ON CONFLICT(Tag) DO UPDATE SET Files = Files + 1, MagnitudeSum = MagnitudeSum + excluded.MagnitudeSum;
+END;
+
+CREATE TRIGGER IF NOT EXISTS TagStatsTagDelete AFTER DELETE ON Tags BEGIN
+  DELETE FROM TagStats WHERE Tag = old.Code;
+END;
+
+/* Count the existing tags */
+INSERT INTO TagStats(Tag, Files, MagnitudeSum) SELECT Tag, COUNT(*), IFNULL(SUM(Magnitude), 0) FROM TagsFiles GROUP BY Tag;
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import os
+from array import array
+from concurrent.futures import ThreadPoolExecutor
 
 ##########
 ## Json ##
@@ -22,13 +24,18 @@ import json
 ###############
 
 from src.Utils.Magic import guessMime
+from src.Utils.Fingerprint import getFingerprint
 
 ############
 ## DBItem ##
 ############
 
+# NOTE: the items use __slots__, large results (i.e. all the files) are much smaller
+
 class DBItem():
   
+  __slots__ = ('code', 'name')
+  
   def __init__(self, code, name): 
     self.code = code
     self.name = name
@@ -57,6 +64,8 @@ class DBItem():
 
 class Category(DBItem):
   
+  __slots__ = ('has_magnitude', )
+  
   def __init__(self, code, name, has_magnitude):
     super().__init__(code, name)
     self.has_magnitude = has_magnitude
@@ -83,9 +92,14 @@ def createCategory(name, has_magnitude):
 
 class Tag(DBItem):
   
+  __slots__ = ('category', 'files_count', 'magnitude_sum')
+  
   def __init__(self, code, name, category):
     super().__init__(code, name)
     self.category = category
+    # NOTE: only set by Database.getAllTags
+    self.files_count = None
+    self.magnitude_sum = None
   
   def getCategory(self):
     return self.category
@@ -93,9 +107,22 @@ class Tag(DBItem):
   def setCategoryCode(self, code):  
     self.category = code
   
+  def getFilesCount(self):
+    return self.files_count
+  
+  def getMagnitudeSum(self):
+    return self.magnitude_sum
+  
+  def setStats(self, files_count, magnitude_sum):
+    self.files_count = files_count
+    self.magnitude_sum = magnitude_sum
+  
   def toArray(self):
     res = super().toArray()
     res['category'] = self.getCategory()
+    if self.files_count is not None:
+      res['files_count'] = self.getFilesCount()
+      res['magnitude_sum'] = self.getMagnitudeSum()
     return res
   
 def createTag(name, category_code):
@@ -107,13 +134,31 @@ def createTag(name, category_code):
 ## File ##
 ##########
 
+MIME_WORKERS = 8
+
 class File(DBItem):
   
-  def __init__(self, code, name, location, mime):
-    super().__init__(code, name)
+  __slots__ = ('location', 'mime', 'fingerprint', '_path')
+  
+  def __init__(self, code, name, location, mime, fingerprint=None):
+    self.code = code
+    self.name = name
     self.location = location
-    self.path = os.path.join(self.location, self.name)
     self.mime = mime
+    # NOTE: only set for the new files (not loaded by the queries)
+    self.fingerprint = fingerprint
+    # computed when needed
+    self._path = None
+  
+  @property
+  def path(self):
+    if self._path is None:
+      self._path = os.path.join(self.location, self.name)
+    return self._path
+  
+  def setName(self, name):
+    self.name = name
+    self._path = None
   
   def getLocation(self):
     return self.location
@@ -124,6 +169,12 @@ class File(DBItem):
   def getMime(self):
     return self.mime
   
+  def getFingerprint(self):
+    return self.fingerprint
+  
+  def setFingerprint(self, fingerprint):
+    self.fingerprint = fingerprint
+  
   def toArray(self):
     res = super().toArray()
     res['location'] = self.getLocation()
@@ -138,13 +189,171 @@ def loadFile(filepath, root):
   if not os.path.exists(filepath):
     return None
   code = -1
-  mime = guessMime(filepath)
+  mime, fingerprint = loadFileData(filepath)
   relpath = os.path.relpath(filepath, root)
   location = os.path.dirname(relpath)
   name = os.path.basename(relpath)
-  new_file = File(code, name, location, mime)
+  new_file = File(code, name, location, mime, fingerprint)
   return new_file
 
+def loadFileData(filepath):
+  # Return the mime type and the fingerprint of a file
+  return guessMime(filepath), getFingerprint(filepath)
+
+def loadFiles(filepaths, root, workers=MIME_WORKERS):
+  # Same as loadFile for many files (the invalid ones are skipped),
+  # the mime types are guessed in parallel
+  paths = []
+  for filepath in filepaths:
+    filepath = os.path.abspath(filepath)
+    if filepath.startswith(root) and os.path.exists(filepath):
+      paths.append(filepath)
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    files_data = list(executor.map(loadFileData, paths))
+  new_files = []
+  for filepath, (mime, fingerprint) in zip(paths, files_data):
+    relpath = os.path.relpath(filepath, root)
+    location = os.path.dirname(relpath)
+    name = os.path.basename(relpath)
+    new_files.append(File(-1, name, location, mime, fingerprint))
+  return new_files
+
+##############
+## FileList ##
+##############
+
+class StringTable():
+  # Each string is stored once, the lists keep its index
+  
+  __slots__ = ('strings', 'indexes')
+  
+  def __init__(self):
+    self.strings = []
+    self.indexes = {}
+  
+  def getIndex(self, string):
+    index = self.indexes.get(string)
+    if index is None:
+      index = len(self.strings)
+      self.strings.append(string)
+      self.indexes[string] = index
+    return index
+  
+  def getString(self, index):
+    return self.strings[index]
+  
+  def __len__(self):
+    return len(self.strings)
+
+class FileList():
+  # Columnar list of files: the codes are kept in an array, the locations and the
+  # mime types in shared string tables, the File objects are created on demand.
+  # NOTE: the slices share the columns with the list (no copy) and cannot be extended
+  
+  __slots__ = ('codes', 'names', 'locations', 'mimes', 'locations_table', 'mimes_table', 'start', 'stop')
+  
+  def __init__(self, locations_table=None, mimes_table=None):
+    self.codes = array('q')
+    self.names = []
+    self.locations = array('I')
+    self.mimes = array('I')
+    self.locations_table = StringTable() if locations_table is None else locations_table
+    self.mimes_table = StringTable() if mimes_table is None else mimes_table
+    # range of the columns of this list, stop is None if the list is not a slice
+    self.start = 0
+    self.stop = None
+  
+  def _getStop(self):
+    return len(self.codes) if self.stop is None else self.stop
+  
+  def append(self, code, name, location, mime):
+    if self.stop is not None:
+      raise ValueError('A slice of a FileList cannot be extended')
+    self.codes.append(code)
+    self.names.append(name)
+    self.locations.append(self.locations_table.getIndex(location))
+    self.mimes.append(self.mimes_table.getIndex(mime))
+  
+  def appendFile(self, single_file):
+    self.append(single_file.getCode(), single_file.getName(), single_file.getLocation(), single_file.getMime())
+  
+  def extend(self, files):
+    if not isinstance(files, FileList):
+      for single_file in files:
+        self.appendFile(single_file)
+      return None
+    # NOTE: the files are copied column by column, without creating them
+    locations_table, mimes_table = files.locations_table, files.mimes_table
+    for index in range(files.start, files._getStop()):
+      location = locations_table.getString(files.locations[index])
+      mime = mimes_table.getString(files.mimes[index])
+      self.append(files.codes[index], files.names[index], location, mime)
+  
+  ## Files
+  def getFile(self, index):
+    return self._getColumnsFile(self._getIndex(index))
+  
+  def _getColumnsFile(self, index):
+    # NOTE: index of the columns, not of the list (see _getIndex)
+    location = self.locations_table.getString(self.locations[index])
+    mime = self.mimes_table.getString(self.mimes[index])
+    return File(self.codes[index], self.names[index], location, mime)
+  
+  def getFileByCode(self, code):
+    # Return the file with the code or None if it is not in the list
+    try:
+      index = self.codes.index(code, self.start, self._getStop())
+    except ValueError:
+      return None
+    return self._getColumnsFile(index)
+  
+  def getCode(self, index):
+    return self.codes[self._getIndex(index)]
+  
+  def getCodes(self):
+    return self.codes[self.start:self._getStop()]
+  
+  def _getIndex(self, index):
+    length = len(self)
+    if index < 0:
+      index += length
+    if index < 0 or index >= length:
+      raise IndexError('FileList index out of range')
+    return self.start + index
+  
+  ## Filters
+  def select(self, indexes):
+    # Return a new list with the files at the given indexes (in that order)
+    result = FileList(self.locations_table, self.mimes_table)
+    start = self.start
+    columns_indexes = [start + index for index in indexes]
+    codes, names, locations, mimes = self.codes, self.names, self.locations, self.mimes
+    result.codes = array('q', [codes[index] for index in columns_indexes])
+    result.names = [names[index] for index in columns_indexes]
+    result.locations = array('I', [locations[index] for index in columns_indexes])
+    result.mimes = array('I', [mimes[index] for index in columns_indexes])
+    return result
+  
+  ## Sequence
+  def __len__(self):
+    return self._getStop() - self.start
+  
+  def __getitem__(self, key):
+    if isinstance(key, slice):
+      start, stop, step = key.indices(len(self))
+      if step != 1:
+        return self.select(range(start, stop, step))
+      view = FileList(self.locations_table, self.mimes_table)
+      view.codes, view.names, view.locations, view.mimes = self.codes, self.names, self.locations, self.mimes
+      view.start = self.start + start
+      view.stop = self.start + max(start, stop)
+      return view
+    return self.getFile(key)
+  
+  def __iter__(self):
+    for index in range(self.start, self._getStop()):
+      yield self._getColumnsFile(index)
+
 ##################
 ## Configurable ##
 ##################
@@ -158,6 +367,7 @@ class Configurable():
     self.config = self.loadConfig(self.config_file)
     if not os.path.exists(self.config_file):
       self.saveConfig()
+    self.config_mtime = self._getConfigMtime()
   
   def getConfigFolder(self):
     return self.config_folder
@@ -179,6 +389,19 @@ class Configurable():
       config = self.overwriteConfig(config, new_config)
     return config
   
+  def reloadConfig(self):
+    self.config = self.loadConfig(self.config_file)
+    self.config_mtime = self._getConfigMtime()
+  
+  def configChanged(self):
+    return self._getConfigMtime() != self.config_mtime
+  
+  def _getConfigMtime(self):
+    if os.path.exists(self.config_file):
+      return os.stat(self.config_file).st_mtime_ns
+    else:
+      return None
+  
   def overwriteConfig(self, config, new_config):
     for key in new_config:
       config[key] = new_config[key]
@@ -194,6 +417,8 @@ class Configurable():
     hand = open(path, 'w')
     hand.write(data)
     hand.close()
+    if path == self.config_file:
+      self.config_mtime = self._getConfigMtime()
   
   def parseJson(self, path):
     # Json decoder
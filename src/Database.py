@@ -1,14 +1,25 @@
 #!/usr/bin/python3
 
 import os
+import sys
 import sqlite3
 from subprocess import Popen
 
 from src.Common import Tag
 from src.Common import Category
 from src.Common import File
+from src.Common import FileList
+from src.Common import json_dumps
+from src import TagsIndex
+from src import TagQuery
+from src.TagQuery import QueryError
 
 from src.Constants import SQL_FOLDER
+from src.Constants import MIGRATIONS_FOLDER
+
+PAGE_SIZE = 200
+CODES_CHUNK_SIZE = 500
+NAME_INDEX_MIN_LENGTH = 3
 
 #################
 ## TSDatabase ###
@@ -28,8 +39,12 @@ def databaseCommit(method):
 
 class Database():
 
-  def __init__(self, db_path):
+  def __init__(self, db_path, check_same_thread=True):
     self.db_path = db_path
+    self.check_same_thread = check_same_thread
+    # optional in-memory index of the tags (see loadTagsIndex)
+    self.tags_index = None
+    self.tags_index_version = None
     self._setupDBFolder()
     self._loadDatabase()
   
@@ -41,6 +56,17 @@ class Database():
   def commit(self):
     self._conn.commit()
   
+  def interrupt(self):
+    # Abort the running query (can be called from any thread)
+    self._conn.interrupt()
+  
+  def rollback(self):
+    in_transaction = self._conn.in_transaction
+    self._conn.rollback()
+    if in_transaction:
+      # the tags index may have the discarded changes
+      self.tags_index_version = None
+  
   ## Database
   def _loadDatabase(self):
     if not os.path.exists(self.db_path):
@@ -50,58 +76,404 @@ class Database():
       process = Popen(["sqlite3", self.db_path], stdin=sql_file)
       process.communicate()
     # Load db
-    self._conn = sqlite3.connect(self.db_path)
+    self._conn = sqlite3.connect(self.db_path, check_same_thread=self.check_same_thread)
     self.db = self._conn.cursor()
+    # Update the schema
+    self._migrateDatabase()
+  
+  ## Migrations
+  def _migrateDatabase(self):
+    # NOTE: the schema version is stored in PRAGMA user_version,
+    #       data.sql is version 0 and each migration file NNNN_name.sql
+    #       in the migrations folder upgrades the schema to version NNNN
+    for migration_version, migration_file in self._getMigrations():
+      if migration_version > self.getSchemaVersion():
+        self._applyMigration(migration_version, migration_file)
+  
+  def getSchemaVersion(self):
+    self.db.execute('PRAGMA user_version')
+    return self.db.fetchone()[0]
+  
+  def _getMigrations(self):
+    migrations = []
+    for fname in os.listdir(MIGRATIONS_FOLDER):
+      name, ext = os.path.splitext(fname)
+      if ext == '.sql':
+        version = int(name.split('_')[0])
+        migrations.append((version, os.path.join(MIGRATIONS_FOLDER, fname)))
+    migrations.sort()
+    return migrations
+  
+  def _applyMigration(self, version, migration_file):
+    with open(migration_file, 'r') as hand:
+      script = hand.read()
+    # NOTE: the write lock is taken before reading the version again, another
+    #       process opening the database may have applied the migration
+    # NOTE: executescript commits first, the statements are run one at a time
+    self._conn.execute('BEGIN IMMEDIATE')
+    try:
+      if self.getSchemaVersion() < version:
+        for statement in splitStatements(script):
+          self.db.execute(statement)
+        self.db.execute('PRAGMA user_version = ' + str(int(version)))
+      self._conn.commit()
+    except sqlite3.Error:
+      self._conn.rollback()
+      raise
   
   def close(self):
     self.db.close()
     self._conn = None
+  
+  ## Tags index
+  def loadTagsIndex(self):
+    # Keep the files of each tag in memory to answer the tags searches and counts
+    self.tags_index = TagsIndex.start()
+    self.tags_index_version = None
+    self.getTagsIndex()
+  
+  def getTagsIndex(self):
+    # Return the tags index (None if not loaded)
+    # NOTE: the data version changes when another connection commits,
+    #       the changes of this connection update the index directly
+    if self.tags_index is None:
+      return None
+    version = self._conn.execute('PRAGMA data_version').fetchone()[0]
+    if version != self.tags_index_version:
+      self.tags_index.load(self._conn.cursor())
+      self.tags_index_version = version
+    return self.tags_index
+  
+  def _getIndexedFilesQuery(self, files_bitmap, params):
+    # Condition on the files (alias F) of the bitmap
+    params['files_codes'] = json_dumps(TagsIndex.getCodes(files_bitmap))
+    return 'F.Code IN (SELECT value FROM json_each(:files_codes))'
     
   ## Get
-  def getFilesWithTags(self, tags, use_magnitude=False, limit=None, name_contains=None):
-    # parameters
-    params = {}
-    if name_contains is not None:
-      params['name_contains'] = '%' + name_contains + '%'
+  def getFilesWithTags(self, tags, use_magnitude=False, limit=None, name_contains=None, weights=None, columnar=False, query=None):
     # base query
-    query = 'SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F'
-    for tag in tags:
-      query += ' INTERSECT SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F, TagsFiles TF WHERE F.Code = TF.File AND TF.Tag = ' + str(int(tag))
-    if name_contains is not None:
-      query += ' INTERSECT SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F WHERE LOWER(F.Name) LIKE :name_contains'
-    query += ' ORDER BY F.Name'
-    # limit
-    if limit is not None:
-      query += ' LIMIT ' + str(limit)
+    match_query, params = self._getFilesMatchQuery(tags, name_contains, use_magnitude, query)
     if len(tags) > 0 and use_magnitude:
-      # NOTE: I order the file using the sum of the magnitudes of the chosen tags
-      # find the files
-      self.db.execute(query, params)
-      files_data = self.db.fetchall()
-      related_files = self.getFilesFromDBData(files_data)
-      codes_list = " ,".join(map(lambda t : str(int(t)), tags))
-      files_codes_list = " ,".join(map(lambda f : str(int(f)), related_files))
-      query = 'SELECT F.Code, F.Location, F.Name, F.Mime, SUM(TF.Magnitude) AS Magnitude FROM Files F, TagsFiles TF WHERE F.Code = TF.File AND TF.Tag IN ( ' + codes_list + ') AND F.Code IN ( ' + files_codes_list + ' ) GROUP BY F.Code ORDER BY Magnitude DESC'
+      # NOTE: I order the file using the (weighted) sum of the magnitudes of the chosen tags
+      score = self._getMagnitudeExpression(params, weights)
+      query = 'SELECT F.Code, F.Location, F.Name, F.Mime' + match_query + ' ORDER BY ' + score + ' DESC, F.Code'
+    else:
+      query = 'SELECT F.Code, F.Location, F.Name, F.Mime' + match_query + ' ORDER BY F.Name, F.Code'
+    # limit (with the magnitude only the best files are kept while sorting)
+    if limit is not None:
+      query += ' LIMIT ' + str(int(limit))
     # execute query
     self.db.execute(query, params)
-    # fetch result
-    files_data = self.db.fetchall()
-    # organize results
-    result_data = self.getFilesFromDBData(files_data)
+    # organize results (the rows are read one at a time)
+    result_data = self.getFilesFromDBData(self.db, columnar)
     return result_data
   
-  def getFilesWithNoTags(self):
-    query = 'SELECT Code, Location, Name, Mime FROM Files WHERE Code NOT IN (SELECT File FROM TagsFiles GROUP BY File)'
-    self.db.execute(query)
+  def getFilesWithTagsPage(self, tags, cursor=None, page_size=PAGE_SIZE, use_magnitude=False, name_contains=None, weights=None, columnar=False, query=None):
+    # Return a page of the files of getFilesWithTags (same order) starting after
+    # the cursor and the cursor of the next page (None if this is the last one)
+    # NOTE: the cursor is (name, code) or (magnitude, code) if ordered by magnitude
+    match_query, params = self._getFilesMatchQuery(tags, name_contains, use_magnitude, query)
+    if len(tags) > 0 and use_magnitude:
+      sort_key = self._getMagnitudeExpression(params, weights)
+      after = '(' + sort_key + ' < :cursor_key OR (' + sort_key + ' = :cursor_key AND F.Code > :cursor_code))'
+      order = sort_key + ' DESC, F.Code'
+    else:
+      sort_key = 'F.Name'
+      after = '(F.Name, F.Code) > (:cursor_key, :cursor_code)'
+      order = 'F.Name, F.Code'
+    if cursor is not None:
+      if ' WHERE ' in match_query:
+        match_query += ' AND ' + after
+      else:
+        match_query += ' WHERE ' + after
+      params['cursor_key'], params['cursor_code'] = cursor
+    # NOTE: one more file tells if there is a next page
+    query = 'SELECT F.Code, F.Location, F.Name, F.Mime, ' + sort_key + match_query + ' ORDER BY ' + order + ' LIMIT ' + str(int(page_size) + 1)
+    self.db.execute(query, params)
     files_data = self.db.fetchall()
-    all_files = self.getFilesFromDBData(files_data)
+    if len(files_data) > page_size:
+      last = files_data[page_size - 1]
+      next_cursor = (last[4], last[0])
+      files_data = files_data[:page_size]
+    else:
+      next_cursor = None
+    return self.getFilesFromDBData(files_data, columnar), next_cursor
+  
+  def _getFilesMatchQuery(self, tags, name_contains=None, use_magnitude=False, query=None):
+    # Return the FROM/WHERE part of a query matching the files (alias F)
+    # with all the given tags, the given name and the tags query (see TagQuery).
+    # NOTE: the tags are joined starting from the rarest one so that
+    #       the other tags are only probed (on the primary key) for its files
+    # NOTE: with the tags index the files with all the tags are found in memory,
+    #       the tags are joined only for their magnitudes
+    params = {}
+    tables = []
+    conditions = []
+    if query is not None:
+      query = self.resolveQuery(query)
+    tags_index = self.getTagsIndex()
+    files_bitmap = None
+    if tags_index is not None and not use_magnitude and len(set(map(int, tags))) > 1:
+      files_bitmap = tags_index.getFilesBitmap(tags)
+      tags_codes = []
+    else:
+      cardinality = self.getTagsCardinality(tags)
+      tags_codes = sorted(cardinality, key=lambda code : cardinality[code])
+    if query is not None and tags_index is not None:
+      query_bitmap = tags_index.getQueryBitmap(query)
+      files_bitmap = query_bitmap if files_bitmap is None else files_bitmap & query_bitmap
+      query = None
+    if files_bitmap is not None:
+      conditions.append(self._getIndexedFilesQuery(files_bitmap, params))
+    for index, code in enumerate(tags_codes):
+      alias = 'TF' + str(index)
+      key = 'tag' + str(index)
+      tables.append('TagsFiles ' + alias)
+      conditions.append(alias + '.Tag = :' + key)
+      if index > 0:
+        conditions.append(alias + '.File = TF0.File')
+      params[key] = code
+    tables.append('Files F')
+    if len(tags_codes) > 0:
+      conditions.append('F.Code = TF0.File')
+    if query is not None:
+      conditions.extend(self._getQueryConditions(query, params, len(conditions) == 0))
+    if name_contains is not None:
+      conditions.append(self._getNameCondition(name_contains, len(conditions) == 0))
+      params['name_contains'] = '%' + name_contains + '%'
+    # CROSS JOIN keeps the join order chosen above
+    query = ' FROM ' + ' CROSS JOIN '.join(tables)
+    if len(conditions) > 0:
+      query += ' WHERE ' + ' AND '.join(conditions)
+    return query, params
+  
+  ## Tags query
+  def resolveQuery(self, query):
+    # Return the query (see TagQuery) with each tag and category replaced by the
+    # codes of its tags (NODE_TAGS), raise QueryError if one of them does not exist
+    # NOTE: the names are compared ignoring the case if there is no exact match
+    tags_names = TagQuery.getNodeNames(query, TagQuery.NODE_TAG)
+    tags = {}
+    if len(tags_names) > 0:
+      self.db.execute('SELECT Name, Code FROM Tags WHERE Name IN (SELECT value FROM json_each(?))', (json_dumps(list(tags_names)), ))
+      tags.update(self.db.fetchall())
+      for name in tags_names - set(tags):
+        self.db.execute('SELECT Code FROM Tags WHERE LOWER(Name) = LOWER(?)', (name, ))
+        result = self.db.fetchone()
+        if result is None:
+          raise QueryError('Unknown tag: ' + name)
+        tags[name] = result[0]
+    categories_names = TagQuery.getNodeNames(query, TagQuery.NODE_CATEGORY)
+    categories = {}
+    for name in categories_names:
+      self.db.execute('SELECT Code FROM Categories WHERE Name = ? OR LOWER(Name) = LOWER(?) ORDER BY Name = ? DESC', (name, name, name))
+      result = self.db.fetchone()
+      if result is None:
+        raise QueryError('Unknown category: ' + name)
+      self.db.execute('SELECT Code FROM Tags WHERE Category = ?', (result[0], ))
+      categories[name] = frozenset(code for (code, ) in self.db.fetchall())
+    return self._resolveQueryNode(query, tags, categories)
+  
+  def _resolveQueryNode(self, node, tags, categories):
+    node_type = node[0]
+    if node_type == TagQuery.NODE_TAG:
+      return (TagQuery.NODE_TAGS, frozenset([tags[node[1]]]))
+    elif node_type == TagQuery.NODE_CATEGORY:
+      return (TagQuery.NODE_TAGS, categories[node[1]])
+    elif node_type == TagQuery.NODE_NOT:
+      return (TagQuery.NODE_NOT, self._resolveQueryNode(node[1], tags, categories))
+    elif node_type in (TagQuery.NODE_AND, TagQuery.NODE_OR):
+      children = [self._resolveQueryNode(child, tags, categories) for child in node[1]]
+      if node_type == TagQuery.NODE_OR:
+        # any of the tags of the children
+        codes = [child[1] for child in children if child[0] == TagQuery.NODE_TAGS]
+        if len(codes) > 1:
+          children = [child for child in children if child[0] != TagQuery.NODE_TAGS]
+          children.append((TagQuery.NODE_TAGS, frozenset().union(*codes)))
+      return TagQuery.joinNodes(node_type, children)
+    return node
+  
+  def _getQueryConditions(self, query, params, drive=True):
+    # Return the conditions on the files (alias F) matching a resolved query
+    # NOTE: the clauses of an and are ordered by their estimated number of files, if drive
+    #       the first set of tags gives the files (on the primary key) and the other
+    #       clauses only probe them
+    cardinality = self.getTagsCardinality(TagQuery.getNodeTags(query))
+    query, _ = self._planQuery(query, cardinality, self.getFilesCountEstimate())
+    if query[0] == TagQuery.NODE_AND:
+      clauses = list(query[1])
+    else:
+      clauses = [query]
+    conditions = []
+    if drive:
+      for clause in clauses:
+        if clause[0] == TagQuery.NODE_TAGS:
+          clauses.remove(clause)
+          conditions.append('F.Code IN (SELECT File FROM TagsFiles WHERE ' + self._getQueryTagsCondition(clause[1], params) + ')')
+          break
+    for clause in clauses:
+      conditions.append(self._compileQuery(clause, params))
+    return conditions
+  
+  def _planQuery(self, node, cardinality, files_count):
+    # Return the node with the clauses ordered and its estimated number of files
+    # NOTE: the untagged files are not counted, they are estimated as half of the files
+    node_type = node[0]
+    if node_type == TagQuery.NODE_TAGS:
+      return node, min(files_count, sum(cardinality.get(code, 0) for code in node[1]))
+    elif node_type == TagQuery.NODE_UNTAGGED:
+      return node, files_count // 2
+    elif node_type == TagQuery.NODE_NOT:
+      child, count = self._planQuery(node[1], cardinality, files_count)
+      return (TagQuery.NODE_NOT, child), files_count - count
+    planned = [self._planQuery(child, cardinality, files_count) for child in node[1]]
+    if node_type == TagQuery.NODE_AND:
+      # the clause with less files first, the next ones are checked only for its files
+      planned.sort(key=lambda item : item[1])
+      count = files_count
+      for _, child_count in planned:
+        count = count * child_count // max(files_count, 1)
+    else:
+      # the clause with more files first, the next ones are checked only if it fails
+      planned.sort(key=lambda item : -item[1])
+      count = min(files_count, sum(child_count for _, child_count in planned))
+    return (node_type, tuple(child for child, _ in planned)), count
+  
+  def _compileQuery(self, node, params):
+    # Return the condition on the files (alias F) of a planned query
+    node_type = node[0]
+    if node_type == TagQuery.NODE_TAGS and len(node[1]) == 1:
+      # one lookup on the primary key
+      return 'EXISTS (SELECT 1 FROM TagsFiles WHERE File = F.Code AND ' + self._getQueryTagsCondition(node[1], params) + ')'
+    elif node_type == TagQuery.NODE_TAGS:
+      # NOTE: the files of the tags are collected once (not for each file)
+      return 'F.Code IN (SELECT File FROM TagsFiles WHERE ' + self._getQueryTagsCondition(node[1], params) + ')'
+    elif node_type == TagQuery.NODE_UNTAGGED:
+      return 'NOT EXISTS (SELECT 1 FROM TagsFiles WHERE File = F.Code)'
+    elif node_type == TagQuery.NODE_NOT:
+      return 'NOT ' + self._compileQuery(node[1], params)
+    operator = ' AND ' if node_type == TagQuery.NODE_AND else ' OR '
+    return '(' + operator.join(self._compileQuery(child, params) for child in node[1]) + ')'
+  
+  def _getQueryTagsCondition(self, tags_codes, params):
+    # Condition on TagsFiles matching any of the tags
+    if len(tags_codes) == 0:
+      return '0'
+    key = 'query' + str(len(params))
+    if len(tags_codes) == 1:
+      params[key] = next(iter(tags_codes))
+      return 'Tag = :' + key
+    params[key] = json_dumps(sorted(tags_codes))
+    return 'Tag IN (SELECT value FROM json_each(:' + key + '))'
+  
+  def _getNameCondition(self, name_contains, driver=True):
+    # Condition on the files (alias F) whose name contains :name_contains,
+    # the driver condition finds the files, the other ones are only checked
+    # NOTE: the trigram index can only be used with at least 3 characters
+    # NOTE: the trigram index returns all the files matching the name, when
+    #       the tags already found the files checking their names is cheaper
+    # NOTE: the trigram LIKE folds the case of the non-ASCII characters and
+    #       misses some names with _ or %, the index only finds the candidates
+    #       of the ASCII names without wildcards and LIKE checks them
+    condition = 'LOWER(F.Name) LIKE :name_contains'
+    if len(name_contains) < NAME_INDEX_MIN_LENGTH or not driver:
+      return condition
+    if not name_contains.isascii() or '_' in name_contains or '%' in name_contains:
+      return condition
+    return 'F.Code IN (SELECT rowid FROM FilesNames WHERE Name LIKE :name_contains) AND ' + condition
+  
+  def _getMagnitudeExpression(self, params, weights=None):
+    # Sum of the magnitudes of the tags joined by _getFilesMatchQuery,
+    # each one multiplied by the weight of its tag ({tag_code: weight}) if given
+    # NOTE: the weights are added to the params of the match query
+    terms = []
+    index = 0
+    while 'tag' + str(index) in params:
+      term = 'IFNULL(TF' + str(index) + '.Magnitude, 0)'
+      if weights is not None:
+        key = 'weight' + str(index)
+        params[key] = float(weights.get(params['tag' + str(index)], 1))
+        term += ' * :' + key
+      terms.append(term)
+      index += 1
+    return '(' + ' + '.join(terms) + ')'
+  
+  def getTagsWeights(self, tags, tags_weights=None, categories_weights=None):
+    # Return the weight of each tag as {tag_code: weight}, the product of the
+    # weight of the tag and the one of its category (1 if not given)
+    tags_codes = list(set(map(int, tags)))
+    result = dict.fromkeys(tags_codes, 1.0)
+    if len(tags_codes) == 0:
+      return result
+    # NOTE: the codes may be strings (i.e. loaded from a json config)
+    if tags_weights:
+      tags_weights = {int(code): weight for code, weight in tags_weights.items()}
+      for code in tags_codes:
+        result[code] *= float(tags_weights.get(code, 1))
+    if categories_weights:
+      categories_weights = {int(code): weight for code, weight in categories_weights.items()}
+      codes_list = " ,".join(map(str, tags_codes))
+      query = 'SELECT Code, Category FROM Tags WHERE Code IN ( ' + codes_list + ' )'
+      self.db.execute(query)
+      for code, category in self.db.fetchall():
+        result[code] *= float(categories_weights.get(category, 1))
+    return result
+  
+  def getTagsCardinality(self, tags):
+    # Return the number of files of each tag as {tag_code: count}
+    tags_codes = list(set(map(int, tags)))
+    result = dict.fromkeys(tags_codes, 0)
+    if len(tags_codes) == 0:
+      return result
+    tags_index = self.getTagsIndex()
+    if tags_index is not None:
+      return tags_index.getCardinality(tags_codes)
+    # NOTE: the counts are kept in TagStats by the triggers on TagsFiles
+    codes_list = " ,".join(map(str, tags_codes))
+    query = 'SELECT Tag, Files FROM TagStats WHERE Tag IN ( ' + codes_list + ' )'
+    self.db.execute(query)
+    for code, count in self.db.fetchall():
+      result[code] = count
+    return result
+  
+  @databaseCommit
+  def rebuildTagStats(self):
+    # Count again the files of each tag (i.e. after changes with the triggers disabled)
+    self.db.execute('DELETE FROM TagStats')
+    query = 'INSERT INTO TagStats(Tag, Files, MagnitudeSum) SELECT Tag, COUNT(*), IFNULL(SUM(Magnitude), 0) FROM TagsFiles GROUP BY Tag'
+    self.db.execute(query)
+  
+  def getFilesCountEstimate(self):
+    # Number of files for the query plans, without counting the Files table
+    # NOTE: the codes are distinct positive integers, the highest one is read
+    #       from the primary key and is an upper bound of the count
+    tags_index = self.getTagsIndex()
+    if tags_index is not None:
+      return tags_index.files.bit_count()
+    self.db.execute('SELECT MAX(Code) FROM Files')
+    count = self.db.fetchone()[0]
+    return 0 if count is None else count
+  
+  def getFilesWithNoTags(self, columnar=False):
+    tags_index = self.getTagsIndex()
+    if tags_index is not None:
+      params = {}
+      condition = self._getIndexedFilesQuery(tags_index.getUntaggedBitmap(), params)
+      self.db.execute('SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F WHERE ' + condition + ' ORDER BY F.Code', params)
+      return self.getFilesFromDBData(self.db, columnar)
+    query = 'SELECT F.Code, F.Location, F.Name, F.Mime FROM Files F WHERE NOT EXISTS (SELECT 1 FROM TagsFiles TF WHERE TF.File = F.Code) ORDER BY F.Code'
+    self.db.execute(query)
+    all_files = self.getFilesFromDBData(self.db, columnar)
     return all_files
     
   def getAllTags(self):
-    query = 'SELECT Code, Name, Category FROM Tags ORDER BY Name'
+    # NOTE: the tags have the number of files and the sum of the magnitudes
+    query = 'SELECT T.Code, T.Name, T.Category, IFNULL(S.Files, 0), IFNULL(S.MagnitudeSum, 0) FROM Tags T LEFT JOIN TagStats S ON S.Tag = T.Code ORDER BY T.Name'
     self.db.execute(query)
     tags_data = self.db.fetchall()
     all_tags = self.getTagsFromDBData(tags_data)
+    for tag, tag_data in zip(all_tags, tags_data):
+      tag.setStats(tag_data[3], tag_data[4])
     return all_tags
   
   def getTagFromCode(self, code):
@@ -149,11 +521,10 @@ class Database():
       category = self.getCategoryFromDBData(category_data)
     return category
     
-  def getAllFiles(self):
+  def getAllFiles(self, columnar=False):
     query = 'SELECT Code, Location, Name, Mime FROM Files'
     self.db.execute(query)
-    files_data = self.db.fetchall()
-    all_files = self.getFilesFromDBData(files_data)
+    all_files = self.getFilesFromDBData(self.db, columnar)
     return all_files
   
   def getAllTagsWithCategory(self, category):
@@ -175,20 +546,84 @@ class Database():
       result[int(tag)] = magnitude
     return result, tags
   
+  def getTagsOfFiles(self, files):
+    # Return the tags of the files as {file_code: {tag_code: magnitude}}
+    # NOTE: the codes are sent in chunks to keep the queries small
+    files_codes = list(set(map(int, files)))
+    result = {code: {} for code in files_codes}
+    for start in range(0, len(files_codes), CODES_CHUNK_SIZE):
+      codes_list = " ,".join(map(str, files_codes[start:start + CODES_CHUNK_SIZE]))
+      query = 'SELECT File, Tag, Magnitude FROM TagsFiles WHERE File IN ( ' + codes_list + ' )'
+      self.db.execute(query)
+      for file_code, tag_code, magnitude in self.db.fetchall():
+        result[file_code][tag_code] = magnitude
+    return result
+  
+  def getTagsOfFilesWithTags(self, tags, name_contains=None, query=None, limit=None):
+    # Return the tags of the files matching the search as {file_code: {tag_code: magnitude}}
+    # or None if more than limit files are matching
+    # NOTE: the untagged files are missing from the result
+    match_query, params = self._getFilesMatchQuery(tags, name_contains, query=query)
+    if limit is not None:
+      # NOTE: one more file tells if there are too many files
+      match_query += ' LIMIT ' + str(int(limit) + 1)
+    query = 'SELECT TF.File, TF.Tag, TF.Magnitude FROM TagsFiles TF WHERE TF.File IN (SELECT F.Code' + match_query + ')'
+    self.db.execute(query, params)
+    result = {}
+    for file_code, tag_code, magnitude in self.db.fetchall():
+      if not file_code in result:
+        result[file_code] = {}
+      result[file_code][tag_code] = magnitude
+    if limit is not None and len(result) > limit:
+      return None
+    return result
+  
+  def getTagsFacets(self, tags, name_contains=None, query=None):
+    # Return the tags of the files matching the search and the number of
+    # matching files of each tag as {tag_code: count}
+    tags_index = self.getTagsIndex()
+    if tags_index is not None and name_contains is None:
+      files_bitmap = tags_index.getFilesBitmap(tags)
+      if query is not None:
+        files_bitmap &= tags_index.getQueryBitmap(self.resolveQuery(query))
+      counts = tags_index.getFacets(files_bitmap)
+      tags = self._getTagsByCodes(counts)
+      return {int(tag): counts[int(tag)] for tag in tags}, tags
+    match_query, params = self._getFilesMatchQuery(tags, name_contains, query=query)
+    query = 'SELECT T.Code, T.Name, T.Category, COUNT(*) FROM TagsFiles TF, Tags T WHERE T.Code = TF.Tag AND TF.File IN (SELECT F.Code' + match_query + ') GROUP BY T.Code ORDER BY T.Name, T.Code'
+    self.db.execute(query, params)
+    tags_data = self.db.fetchall()
+    tags = self.getTagsFromDBData(tags_data)
+    counts = {}
+    for tag_data in tags_data:
+      counts[tag_data[0]] = tag_data[3]
+    return counts, tags
+  
   def getCommonTags(self, files):
+    # Return the tags of any of the files (each tag once) ordered by name
     if len(files) == 0:
       return []
+    tags_index = self.getTagsIndex()
+    if tags_index is not None:
+      counts = tags_index.getFacets(TagsIndex.getBitmap(map(int, files)))
+      return self._getTagsByCodes(counts)
     if len(files) > 1:
       files_codes = " ,".join(map(lambda f : str(int(f)), files))
-      query = 'SELECT T.Code, T.Name, T.Category FROM TagsFiles TF, Tags T WHERE T.Code = TF.Tag AND TF.File IN (' + files_codes + ') ORDER BY T.Name'
+      query = 'SELECT DISTINCT T.Code, T.Name, T.Category FROM TagsFiles TF, Tags T WHERE T.Code = TF.Tag AND TF.File IN (' + files_codes + ') ORDER BY T.Name, T.Code'
     else:
       f = files[0]
-      query = 'SELECT T.Code, T.Name, T.Category FROM TagsFiles TF, Tags T WHERE T.Code = TF.Tag AND TF.File = ' + str(int(f)) + ' ORDER BY T.Name'
+      query = 'SELECT T.Code, T.Name, T.Category FROM TagsFiles TF, Tags T WHERE T.Code = TF.Tag AND TF.File = ' + str(int(f)) + ' ORDER BY T.Name, T.Code'
     self.db.execute(query)
     tags_data = self.db.fetchall()
     tags = self.getTagsFromDBData(tags_data)
     return tags
   
+  def _getTagsByCodes(self, tags_codes):
+    # Return the tags with the codes ordered by name
+    query = 'SELECT Code, Name, Category FROM Tags WHERE Code IN (SELECT value FROM json_each(?)) ORDER BY Name, Code'
+    self.db.execute(query, (json_dumps(list(tags_codes)), ))
+    return self.getTagsFromDBData(self.db.fetchall())
+  
   ## ADD/DELETE
   @databaseCommit
   def addTag(self, tag):
@@ -207,17 +642,21 @@ class Database():
     self.db.execute(query, (int(tag), ))
     query = 'DELETE FROM TagsFiles WHERE Tag = ?'
     self.db.execute(query, (int(tag), ))
+    if self.tags_index is not None:
+      self.tags_index.removeTag(int(tag))
   
   @databaseCommit
   def addFile(self, nfile):
-    query = 'INSERT INTO Files(Location, Name, Mime) VALUES (?, ?, ?)'
-    file_data = (nfile.getLocation(), nfile.getName(), nfile.getMime())
+    query = 'INSERT INTO Files(Location, Name, Mime, Fingerprint) VALUES (?, ?, ?, ?)'
+    file_data = (nfile.getLocation(), nfile.getName(), nfile.getMime(), nfile.getFingerprint())
     try:
       self.db.execute(query, file_data)
     except sqlite3.IntegrityError:
       return None
     code = self.db.lastrowid
     nfile.setCode(code)
+    if self.tags_index is not None:
+      self.tags_index.addFile(code)
     return code
   
   @databaseCommit
@@ -234,6 +673,8 @@ class Database():
     self.db.execute(query, (del_file.getCode(), ))
     query = 'DELETE FROM TagsFiles WHERE File = ?'
     self.db.execute(query, (del_file.getCode(), ))
+    if self.tags_index is not None:
+      self.tags_index.removeFiles([del_file.getCode()])
   
   @databaseCommit
   def addCategory(self, category):
@@ -290,17 +731,38 @@ class Database():
   def addTagToFile(self, tag, single_file, magnitude=1):
     query = 'INSERT INTO TagsFiles(Tag, File, Magnitude) VALUES (?, ?, ?)'
     self.db.execute(query, (int(tag), int(single_file), magnitude))
+    if self.tags_index is not None:
+      self.tags_index.addTagToFiles(int(tag), [int(single_file)])
   
   @databaseCommit
   def removeTagFromFile(self, tag, single_file):
     query = 'DELETE FROM TagsFiles WHERE Tag = ? AND File = ?'
     self.db.execute(query, (int(tag), int(single_file)))
+    if self.tags_index is not None:
+      self.tags_index.removeTagFromFiles(int(tag), [int(single_file)])
   
   @databaseCommit
   def changeTagMagnitudeForFile(self, tag, single_file, new_magnitude):
     query = 'UPDATE TagsFiles SET Magnitude = ? WHERE Tag = ? AND File = ?'
     self.db.execute(query, (new_magnitude, int(tag), int(single_file)))
   
+  @databaseCommit
+  def addTagToFiles(self, tag, files, magnitude=1):
+    # Add the tag to the files or set its magnitude if they already have it
+    query = 'INSERT INTO TagsFiles(Tag, File, Magnitude) VALUES (?, ?, ?) ON CONFLICT(Tag, File) DO UPDATE SET Magnitude = excluded.Magnitude'
+    tag_code = int(tag)
+    self.db.executemany(query, ((tag_code, int(single_file), magnitude) for single_file in files))
+    if self.tags_index is not None:
+      self.tags_index.addTagToFiles(tag_code, map(int, files))
+  
+  @databaseCommit
+  def removeTagFromFiles(self, tag, files):
+    query = 'DELETE FROM TagsFiles WHERE Tag = ? AND File = ?'
+    tag_code = int(tag)
+    self.db.executemany(query, ((tag_code, int(single_file)) for single_file in files))
+    if self.tags_index is not None:
+      self.tags_index.removeTagFromFiles(tag_code, map(int, files))
+  
   @databaseCommit
   def changeFilePath(self, single_file, location, name):
     query = 'UPDATE Files SET Location = ?, Name = ? WHERE Code = ?'
@@ -331,6 +793,76 @@ class Database():
     else:
       return self.getFileFromDBData(data)
   
+  def getFilesByRelativePaths(self, paths):
+    # Return the files with the given paths as {path: file}
+    result = {}
+    pairs = [(os.path.dirname(path), os.path.basename(path)) for path in paths]
+    # NOTE: two parameters for each file
+    chunk_size = CODES_CHUNK_SIZE // 2
+    for start in range(0, len(pairs), chunk_size):
+      chunk = pairs[start:start + chunk_size]
+      query = 'SELECT Code, Location, Name, Mime FROM Files WHERE (Location, Name) IN (VALUES ' + ', '.join(['(?, ?)'] * len(chunk)) + ')'
+      self.db.execute(query, [value for pair in chunk for value in pair])
+      for single_file in self.getFilesFromDBData(self.db.fetchall()):
+        result[single_file.getPath()] = single_file
+    return result
+  
+  def getFingerprintsOfFiles(self, files):
+    # Return the known fingerprints of the files as {file_code: fingerprint}
+    files_codes = list(set(map(int, files)))
+    result = {}
+    for start in range(0, len(files_codes), CODES_CHUNK_SIZE):
+      codes_list = " ,".join(map(str, files_codes[start:start + CODES_CHUNK_SIZE]))
+      query = 'SELECT Code, Fingerprint FROM Files WHERE Code IN ( ' + codes_list + ' ) AND Fingerprint IS NOT NULL'
+      self.db.execute(query)
+      result.update(self.db.fetchall())
+    return result
+  
+  def getFilesByFingerprints(self, fingerprints):
+    # Return the files with the given fingerprints as {fingerprint: [files]}
+    fingerprints = list(set(fingerprints))
+    result = {}
+    for start in range(0, len(fingerprints), CODES_CHUNK_SIZE):
+      chunk = fingerprints[start:start + CODES_CHUNK_SIZE]
+      query = 'SELECT Code, Location, Name, Mime, Fingerprint FROM Files WHERE Fingerprint IN ( ' + ', '.join(['?'] * len(chunk)) + ' )'
+      self.db.execute(query, chunk)
+      for file_data in self.db.fetchall():
+        single_file = self.getFileFromDBData(file_data)
+        single_file.setFingerprint(file_data[4])
+        if not file_data[4] in result:
+          result[file_data[4]] = []
+        result[file_data[4]].append(single_file)
+    return result
+  
+  def getFilesWithoutFingerprint(self):
+    query = 'SELECT Code, Location, Name, Mime FROM Files WHERE Fingerprint IS NULL'
+    self.db.execute(query)
+    return self.getFilesFromDBData(self.db.fetchall())
+  
+  @databaseCommit
+  def setFilesFingerprints(self, fingerprints):
+    # fingerprints = [(file, fingerprint)]
+    query = 'UPDATE Files SET Fingerprint = ? WHERE Code = ?'
+    self.db.executemany(query, ((fingerprint, int(single_file)) for single_file, fingerprint in fingerprints))
+  
+  def getFilesInLocation(self, location):
+    # Return the files in the location and in its subfolders
+    query = 'SELECT Code, Location, Name, Mime FROM Files WHERE Location = ? OR substr(Location, 1, ?) = ?'
+    self.db.execute(query, (location, len(location) + 1, location + '/'))
+    return self.getFilesFromDBData(self.db.fetchall())
+  
+  @databaseCommit
+  def changeFilesLocation(self, location, new_location):
+    # Move the files of the location and of its subfolders to new_location
+    query = 'UPDATE Files SET Location = ? || substr(Location, ?) WHERE Location = ? OR substr(Location, 1, ?) = ?'
+    self.db.execute(query, (new_location, len(location) + 1, location, len(location) + 1, location + '/'))
+  
+  def getFilesNamesInLocation(self, location):
+    # Return the set of the names of the files in the location
+    query = 'SELECT Name FROM Files WHERE Location = ?'
+    self.db.execute(query, (location, ))
+    return set(name for (name, ) in self.db.fetchall())
+  
   def getFilesByName(self, name):
     query = 'SELECT Code, Location, Name, Mime FROM Files WHERE Name = ?'
     self.db.execute(query, (name,))
@@ -339,18 +871,27 @@ class Database():
     return result
   
   ## DB Item creation
-  def getFilesFromDBData(self, files_data):
-    files = []
+  def getFilesFromDBData(self, files_data, columnar=False):
+    # Return a list of File or a FileList if columnar
+    # NOTE: the locations and the mime types are shared by many files,
+    #       they are interned to keep one copy of each string
+    if columnar:
+      return self.getFileListFromDBData(files_data)
+    intern = sys.intern
+    return [File(file_data[0], file_data[2], intern(file_data[1]), file_data[3] and intern(file_data[3])) for file_data in files_data]
+  
+  def getFileListFromDBData(self, files_data):
+    files = FileList()
+    append = files.append
     for file_data in files_data:
-      new_file = self.getFileFromDBData(file_data)
-      files.append(new_file)
+      append(file_data[0], file_data[2], file_data[1], file_data[3])
     return files
   
   def getFileFromDBData(self, file_data):
     code = file_data[0]
-    location = file_data[1]
+    location = sys.intern(file_data[1])
     name = file_data[2]
-    mime = file_data[3]
+    mime = file_data[3] and sys.intern(file_data[3])
     return File(code, name, location, mime)
   
   def getTagsFromDBData(self, tags_data):
@@ -379,6 +920,17 @@ class Database():
     has_magnitude = category_data[2]
     return Category(code, name, has_magnitude)
 
-def start(db_path):
-  db = Database(db_path)
+def splitStatements(script):
+  # Return the SQL statements of the script (the triggers have ; inside)
+  statements = []
+  statement = ''
+  for part in script.split(';'):
+    statement += part + ';'
+    if sqlite3.complete_statement(statement):
+      statements.append(statement)
+      statement = ''
+  return [statement for statement in statements if statement.strip(' \t\n;') != '']
+
+def start(db_path, **kwargs):
+  db = Database(db_path, **kwargs)
   return db
@@ -0,0 +1,230 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+
+try:
+  from inotify_simple import INotify
+  from inotify_simple import flags
+except ImportError:
+  INotify = None
+
+from src.Utils.Fingerprint import getFingerprint
+
+READ_TIMEOUT = 1000 # ms
+BATCH_DELAY = 200 # ms
+
+if INotify is not None:
+  WATCH_FLAGS = flags.CREATE | flags.DELETE | flags.MOVED_FROM | flags.MOVED_TO | flags.CLOSE_WRITE | flags.DONT_FOLLOW | flags.ONLYDIR
+
+##################
+## File Watcher ##
+##################
+
+class FileWatcher():
+  # Keep the Files table in sync with the root folder using inotify (optional dependency).
+  # NOTE: the events are applied on a background thread with its own database
+  #       connection, one transaction for each batch of events
+  
+  def __init__(self, profile, on_change=None, on_overflow=None):
+    self.profile = profile
+    self.root = profile.config['root']
+    # on_change() is called from the watcher thread after a batch that moved or deleted files
+    self.on_change = on_change
+    # on_overflow() is called from the watcher thread when events are lost,
+    # the missing files search is needed
+    self.on_overflow = on_overflow
+    self.stopped = threading.Event()
+    self.thread = None
+    self.inotify = None
+    self.db = None
+    # watch descriptor -> folder (relative to the root)
+    self.watches = {}
+    # cookie -> (path, is_dir) of the moved files waiting for the destination
+    self.pending_moves = {}
+  
+  def isAvailable(self):
+    return INotify is not None
+  
+  def start(self):
+    # Return False if inotify is not available
+    if not self.isAvailable():
+      return False
+    self.stopped.clear()
+    self.inotify = INotify()
+    self.addWatches('')
+    self.thread = threading.Thread(target=self._run, daemon=True)
+    self.thread.start()
+    return True
+  
+  def stop(self):
+    self.stopped.set()
+  
+  def join(self, timeout=None):
+    if self.thread is not None:
+      self.thread.join(timeout)
+  
+  def _run(self):
+    self.db = self.profile.openDatabase(self.profile.getDatabase().db_path)
+    try:
+      while not self.stopped.is_set():
+        events = self.inotify.read(timeout=READ_TIMEOUT, read_delay=BATCH_DELAY)
+        # NOTE: the browser is reloaded only if the files were moved or deleted
+        if self.applyEvents(events) and self.on_change is not None:
+          self.on_change()
+    finally:
+      self.db.close()
+      self.db = None
+      self.inotify.close()
+  
+  ## Watches
+  def addWatches(self, folder):
+    # Watch the folder and its subfolders (the ones starting with . are ignored)
+    for base, dirs, files in os.walk(os.path.join(self.root, folder)):
+      dirs[:] = [single_dir for single_dir in dirs if not single_dir.startswith('.')]
+      try:
+        wd = self.inotify.add_watch(base, WATCH_FLAGS)
+      except OSError:
+        # i.e. no permission or max_user_watches reached
+        continue
+      self.watches[wd] = self.getRelativePath(base)
+  
+  def removeWatches(self, folder):
+    for wd, watched in list(self.watches.items()):
+      if isInFolder(watched, folder):
+        del self.watches[wd]
+        try:
+          self.inotify.rm_watch(wd)
+        except OSError:
+          pass
+  
+  def moveWatches(self, folder, new_folder):
+    for wd, watched in self.watches.items():
+      if isInFolder(watched, folder):
+        self.watches[wd] = new_folder + watched[len(folder):]
+  
+  def getRelativePath(self, path):
+    relpath = os.path.relpath(path, self.root)
+    if relpath == '.':
+      relpath = ''
+    return relpath
+  
+  ## Events
+  def applyEvents(self, events):
+    # Return True if files were moved or deleted in the database
+    # NOTE: a move whose destination is not in this batch or in the next one
+    #       left the root folder (or a watched folder)
+    # NOTE: the deletions are applied at the end of the batch, an editor saving
+    #       atomically moves the file to a backup, writes it again and deletes the backup
+    expired_moves = self.pending_moves
+    self.pending_moves = {}
+    # new path -> old path of the files moved in this batch
+    moved = {}
+    deleted = []
+    changed = False
+    modified = False
+    for event in events:
+      if event.mask & flags.Q_OVERFLOW:
+        # some events are lost, the missing files search is needed
+        self.onOverflow()
+        continue
+      if event.mask & flags.IGNORED:
+        self.watches.pop(event.wd, None)
+        continue
+      if not event.wd in self.watches:
+        continue
+      path = os.path.join(self.watches[event.wd], event.name)
+      is_dir = event.mask & flags.ISDIR != 0
+      if event.mask & flags.MOVED_FROM:
+        self.pending_moves[event.cookie] = (path, is_dir)
+      elif event.mask & flags.MOVED_TO:
+        source = self.pending_moves.pop(event.cookie, None)
+        if source is None:
+          source = expired_moves.pop(event.cookie, None)
+        if source is None:
+          self.onCreated(path, is_dir)
+        else:
+          changed = self.onMoved(source[0], path, is_dir) or changed
+          if not is_dir:
+            moved[path] = moved.pop(source[0], source[0])
+      elif event.mask & flags.CREATE:
+        self.onCreated(path, is_dir)
+      elif event.mask & flags.DELETE:
+        deleted.append((path, is_dir))
+      elif event.mask & flags.CLOSE_WRITE:
+        modified = self.onModified(path) or modified
+    for path, is_dir in deleted:
+      if not is_dir and self.isFile(moved.get(path)):
+        # the original file was written again: the tags stay with it
+        changed = self.onMoved(path, moved[path], is_dir) or changed
+        modified = self.onModified(moved[path]) or modified
+      elif not is_dir and self.isFile(path):
+        # deleted and created again in this batch
+        modified = self.onModified(path) or modified
+      else:
+        changed = self.onDeleted(path, is_dir) or changed
+    for path, is_dir in expired_moves.values():
+      self.onMovedOut(path, is_dir)
+    if changed or modified:
+      self.db.commit()
+    return changed
+  
+  def isFile(self, path):
+    return path is not None and os.path.isfile(os.path.join(self.root, path))
+  
+  def onCreated(self, path, is_dir):
+    # NOTE: the new files are not added to the database
+    if is_dir and not os.path.basename(path).startswith('.'):
+      self.addWatches(path)
+  
+  def onMoved(self, path, new_path, is_dir):
+    changed = False
+    if is_dir:
+      self.moveWatches(path, new_path)
+      self.db.changeFilesLocation(path, new_path, commit=False)
+      changed = True
+    tfile = self.db.getFileByRelativePath(path)
+    if tfile is not None:
+      self.db.changeFilePath(tfile, os.path.dirname(new_path), os.path.basename(new_path), commit=False)
+      changed = True
+    return changed
+  
+  def onMovedOut(self, path, is_dir):
+    # NOTE: the files are kept with their tags (i.e. moved to a folder starting
+    #       with . or renamed slowly), the missing files search relinks them
+    if is_dir and not os.path.isdir(os.path.join(self.root, path)):
+      self.removeWatches(path)
+  
+  def onOverflow(self):
+    if self.on_overflow is not None:
+      self.on_overflow()
+  
+  def onDeleted(self, path, is_dir):
+    files = []
+    if is_dir:
+      self.removeWatches(path)
+      files = self.db.getFilesInLocation(path)
+    tfile = self.db.getFileByRelativePath(path)
+    if tfile is not None:
+      files.append(tfile)
+    for tfile in files:
+      self.profile.thumb_manager.removeThumbnail(tfile)
+      self.db.deleteFile(tfile, commit=False)
+    return len(files) > 0
+  
+  def onModified(self, path):
+    # The content changed: the thumbnails and the fingerprint are outdated
+    tfile = self.db.getFileByRelativePath(path)
+    if tfile is None:
+      return False
+    self.profile.thumb_manager.removeThumbnail(tfile)
+    fingerprint = getFingerprint(os.path.join(self.root, path))
+    self.db.setFilesFingerprints([(tfile, fingerprint)], commit=False)
+    return True
+
+def isInFolder(path, folder):
+  return path == folder or path.startswith(folder + '/')
+
+def start(*args, **kwargs):
+  watcher = FileWatcher(*args, **kwargs)
+  return watcher
@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from src.Common import File
+from src.Common import loadFileData
+from src.Utils.Fingerprint import getFingerprint
+
+BATCH_SIZE = 5000
+MIME_CHUNK_SIZE = 64
+
+## Worker process
+def _loadFileData(path):
+  # NOTE: an unreadable file must not stop the import
+  try:
+    return loadFileData(path)
+  except Exception:
+    return None, None
+
+##############
+## Importer ##
+##############
+
+class Importer():
+  # Add to the database all the files of a tree under the root folder,
+  # a new file with the fingerprint of a missing one replaces its path
+  
+  def __init__(self, profile, workers=None, batch_size=BATCH_SIZE, progress=None):
+    self.profile = profile
+    self.db = profile.getDatabase()
+    self.root = profile.config['root']
+    self.workers = workers
+    self.batch_size = batch_size
+    # progress(scanned, added, relinked, failed, elapsed) called after each batch
+    self.progress = progress
+    self._resetStats()
+  
+  def _resetStats(self):
+    self.scanned = 0
+    self.added = 0
+    self.relinked = 0
+    self.failed = 0
+    self.start_time = time.perf_counter()
+  
+  def getElapsed(self):
+    return time.perf_counter() - self.start_time
+  
+  def isInRoot(self, folder):
+    # NOTE: the root itself has a trailing slash
+    return os.path.join(os.path.abspath(folder), '').startswith(self.root)
+  
+  def run(self, folders):
+    # Return (scanned, added, relinked, failed)
+    self._resetStats()
+    batch = []
+    with ProcessPoolExecutor(max_workers=self.workers) as executor:
+      for path in self.walkNewFiles(folders):
+        batch.append(path)
+        if len(batch) >= self.batch_size:
+          self.importBatch(executor, batch)
+          batch = []
+      if len(batch) > 0:
+        self.importBatch(executor, batch)
+    return self.scanned, self.added, self.relinked, self.failed
+  
+  def walkNewFiles(self, folders):
+    # Yield the paths of the files not in the database
+    for folder in folders:
+      if not self.isInRoot(folder):
+        # Out of tree folder
+        continue
+      folder = os.path.abspath(folder)
+      for dirpath, dirnames, filenames in os.walk(folder):
+        dirnames.sort()
+        location = os.path.relpath(dirpath, self.root)
+        if location == '.':
+          location = ''
+        known = self.db.getFilesNamesInLocation(location)
+        for name in sorted(filenames):
+          self.scanned += 1
+          if not name in known:
+            yield os.path.join(dirpath, name)
+  
+  def importBatch(self, executor, paths):
+    files_data = executor.map(_loadFileData, paths, chunksize=MIME_CHUNK_SIZE)
+    new_files = []
+    for path, (mime, fingerprint) in zip(paths, files_data):
+      if mime is None:
+        self.failed += 1
+        continue
+      relpath = os.path.relpath(path, self.root)
+      new_files.append(File(-1, os.path.basename(relpath), os.path.dirname(relpath), mime, fingerprint))
+    # NOTE: one transaction for the whole batch
+    new_files = self.relinkMovedFiles(new_files)
+    codes = self.db.addFiles(new_files)
+    for code in codes:
+      if code is None:
+        self.failed += 1
+      else:
+        self.added += 1
+    if self.progress is not None:
+      self.progress(self.scanned, self.added, self.relinked, self.failed, self.getElapsed())
+  
+  def relinkMovedFiles(self, new_files):
+    # Move the missing files with the fingerprint of a new file to its path,
+    # return the new files to add
+    fingerprints = [new_file.getFingerprint() for new_file in new_files if new_file.getFingerprint() is not None]
+    known = self.db.getFilesByFingerprints(fingerprints)
+    to_add = []
+    for new_file in new_files:
+      moved = None
+      for old_file in known.get(new_file.getFingerprint(), []):
+        if not self.profile.fileExists(old_file):
+          moved = old_file
+          break
+      if moved is None:
+        to_add.append(new_file)
+      else:
+        known[new_file.getFingerprint()].remove(moved)
+        self.db.changeFilePath(moved, new_file.getLocation(), new_file.getName(), commit=False)
+        self.relinked += 1
+    return to_add
+  
+  def updateFingerprints(self):
+    # Compute the fingerprints of the files added before they were introduced,
+    # return the number of updated files
+    files = [single_file for single_file in self.db.getFilesWithoutFingerprint() if self.profile.fileExists(single_file)]
+    paths = [self.profile.getFilePath(single_file) for single_file in files]
+    with ProcessPoolExecutor(max_workers=self.workers) as executor:
+      fingerprints = list(executor.map(getFingerprint, paths, chunksize=MIME_CHUNK_SIZE))
+    updates = [(single_file, fingerprint) for single_file, fingerprint in zip(files, fingerprints) if fingerprint is not None]
+    self.db.setFilesFingerprints(updates)
+    return len(updates)
+
+def start(*args, **kwargs):
+  importer = Importer(*args, **kwargs)
+  return importer
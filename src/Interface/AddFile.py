@@ -297,7 +297,7 @@ class AddFile(BasicInterface):
     # Hide add file (do not close or TagSearch shuts down)
     self.main_window.hide()
     # Open TagFile
-    self.ts.openTagFile(dest)
+    self.ts.openTagFile([dest])
   
   def _addFileAndTags(self, dest):
     mfile = self.ts.loadFile(dest)
@@ -1,22 +1,29 @@
 #!/usr/bin/env python3
 
 import os 
+import sqlite3
+import threading
 import configparser
 from subprocess import Popen
+from concurrent.futures import ThreadPoolExecutor
 
 from gi.repository import Gio
 from gi.repository import Gtk
-from gi.repository import GObject
 from gi.repository import Gdk
+from gi.repository import GLib
 from gi.repository.GdkPixbuf import Pixbuf
 
 from src.Constants import MAIN_FOLDER
 from src.Constants import ICONS_FOLDER
 from src.Constants import UI_FOLDER
 
+from src import ThumbManager
+from src import TagQuery
 from src.Interface import TagEditor
+from src.Utils import LRUCache
 
 from src.Interface.Utils import BasicInterface
+from src.Interface.Utils import Debounce
 from src.Interface.Utils import acceptInterfaceSignals
 from src.Interface.Utils import ignoreSignals
 
@@ -25,6 +32,16 @@ ICON_SIZE = 64
 
 LABEL_LIMIT = 20
 
+PIXBUF_WORKERS = 4
+PIXBUF_MISSING = 1
+
+SEARCH_HISTORY_SIZE = 10
+TAGS_MAP_LIMIT = 50000
+FILES_PAGE_SIZE = 200
+
+SEARCH_DELAY = 250 # ms
+TAGS_FILTER_DELAY = 150 # ms
+
 #############
 ### Tools ###
 #############
@@ -48,6 +65,136 @@ class PseudoCategory():
     return self.name
 
 
+## Search result
+class SearchResult():
+  
+  def __init__(self, key, files, cursor=None, tags_map=None, tags_counts=None):
+    # key = (used tags codes, name contains, use magnitude, tags query)
+    self.key = key
+    # FileList of the loaded files
+    self.files = files
+    # cursor of the next page of files, None if all the files are loaded
+    self.cursor = cursor
+    # tags of all the matching files (also the ones not loaded yet)
+    # {file_code: {tag_code: magnitude}}, None if not loaded
+    self.tags_map = tags_map
+    # number of the matching files of each tag {tag_code: count},
+    # loaded with the files if there is no tags map
+    self.tags_counts = tags_counts
+  
+  def getKey(self):
+    return self.key
+  
+  def getFiles(self):
+    return self.files
+  
+  def getCursor(self):
+    return self.cursor
+  
+  def isComplete(self):
+    return self.cursor is None
+  
+  def addPage(self, files, cursor):
+    self.files.extend(files)
+    self.cursor = cursor
+  
+  def hasTagsMap(self):
+    return self.tags_map is not None
+  
+  def getFileTags(self, file_code):
+    return self.tags_map.get(file_code, {})
+  
+  def getTaggedFilesCount(self):
+    # number of the matching files with tags (also the ones not loaded yet)
+    return len(self.tags_map)
+  
+  def getTagsCounts(self):
+    # number of files of each tag {tag_code: count}
+    if self.tags_map is None:
+      return self.tags_counts
+    counts = {}
+    for file_tags in self.tags_map.values():
+      for code in file_tags:
+        counts[code] = counts.get(code, 0) + 1
+    return counts
+  
+  def refine(self, key, added_tags, use_magnitude, weights=None):
+    # Return the result with the added tags using the tags map
+    # NOTE: only the codes are read, the files are not created
+    # NOTE: the files are ordered by name, the files not loaded yet
+    #       come after the cursor also for the refined search
+    used_tags, _, _, _ = key
+    tags_map = {file_code: file_tags for file_code, file_tags in self.tags_map.items() if all(code in file_tags for code in added_tags)}
+    codes = self.files.getCodes()
+    indexes = [index for index, file_code in enumerate(codes) if file_code in tags_map]
+    if use_magnitude and len(used_tags) > 0:
+      # NOTE: same order of Database.getFilesWithTags
+      def magnitude(index):
+        file_tags = self.getFileTags(codes[index])
+        if weights is None:
+          return -sum(file_tags[code] for code in used_tags), codes[index]
+        return -sum(file_tags[code] * weights.get(code, 1) for code in used_tags), codes[index]
+      indexes.sort(key=magnitude)
+    return SearchResult(key, self.files.select(indexes), self.cursor, tags_map)
+
+## Search scheduler
+class SearchScheduler():
+  # Run the searches on a background thread with its own database connection,
+  # only the result of the last scheduled search is delivered
+  
+  def __init__(self, browser):
+    self.browser = browser
+    self.executor = ThreadPoolExecutor(max_workers=1)
+    self.generation = 0
+    # NOTE: the connection is only used by the worker thread
+    self.db = None
+    self.lock = threading.Lock()
+  
+  def run(self, search, callback):
+    # Call search(db) on the worker and then callback(result) on the main loop
+    generation = self.cancel()
+    self.executor.submit(self._runSearch, generation, search, callback)
+  
+  def cancel(self):
+    # Discard the scheduled searches and abort the running one
+    with self.lock:
+      self.generation += 1
+      if self.db is not None:
+        self.db.interrupt()
+      return self.generation
+  
+  def _runSearch(self, generation, search, callback):
+    if generation != self.generation:
+      return
+    if self.db is None:
+      db = self.browser.ts.openDatabase(self.browser.db.db_path, tags_index=True)
+      with self.lock:
+        self.db = db
+    try:
+      result = search(self.db)
+    except sqlite3.OperationalError as err:
+      if generation == self.generation:
+        self.browser.log.error("SearchScheduler == search failed: " + str(err))
+      return
+    GLib.idle_add(self._deliverResult, generation, result, callback)
+  
+  def _deliverResult(self, generation, result, callback):
+    if generation == self.generation:
+      callback(result)
+    return False
+  
+  def _closeDatabase(self):
+    with self.lock:
+      if self.db is not None:
+        self.db.close()
+        self.db = None
+  
+  def close(self):
+    self.cancel()
+    self.executor.submit(self._closeDatabase)
+    self.executor.shutdown(wait=False)
+
+
 ## Signals Handler
 
 class SHandler():
@@ -77,7 +224,11 @@ class SHandler():
   
   @acceptInterfaceSignals
   def changeName(self, *args):
-    self.interface.searchFiles()
+    self.interface.changeName()
+  
+  @acceptInterfaceSignals
+  def changeQuery(self, *args):
+    self.interface.changeQuery()
   
   @acceptInterfaceSignals
   def loadMoreImages(self, *args):
@@ -195,6 +346,23 @@ class Browser(BasicInterface):
   
   def _setup(self):
     self.profile = self.ts.getProfileName()
+    # Thumbnails are decoded on the pixbuf workers
+    self.pixbuf_executor = ThreadPoolExecutor(max_workers=PIXBUF_WORKERS)
+    self.pixbuf_results = []
+    self.pixbuf_results_lock = threading.Lock()
+    self.files_store_generation = 0
+    self.files_store_rows = {}
+    self.ts.thumb_manager.addThumbnailListener(self.onThumbnailReady)
+    # Decoded thumbnails: (file code, icon size) -> (thumbnail mtime, pixbuf)
+    cache_size = self.ts.config['pixbuf_cache_size'] * 1024 * 1024
+    self.pixbuf_cache = LRUCache.new(cache_size, sizeof=lambda value : value[1].get_byte_length())
+    # Theme icons: mime -> pixbuf
+    self.mime_icons = {}
+    Gtk.IconTheme.get_default().connect('changed', self.onIconThemeChanged)
+    # Type-ahead searches
+    self.search_scheduler = SearchScheduler(self)
+    self.name_search_debounce = Debounce(SEARCH_DELAY, self.searchFilesInBackground)
+    self.tags_filter_debounce = Debounce(TAGS_FILTER_DELAY, self.updateTagsGrid)
     # Inizialize variables
     self.initializeVariables()
   
@@ -286,7 +454,7 @@ class Browser(BasicInterface):
   #############################
   ## Variable initialization ##
   #############################
-  def initializeVariables(self, used_tags=None):
+  def initializeVariables(self, used_tags=None, name_contains=None, query=None):
     self.log.info("initializeVariables == Initialize variables")
     # Config
     self.reloadConfig()
@@ -299,21 +467,26 @@ class Browser(BasicInterface):
     if used_tags is not None:
       self._importUsedTags(used_tags)
     # Current files
-    self.files = self.db.getFilesWithTags(self.used_tags, self.use_magnitude)
+    self.search_scheduler.cancel()
+    self.search_history = []
+    key = self.getSearchKey(name_contains, query)
+    self.current_search = self.runSearch(key, self.getTagsWeights(key))
+    self.pushSearch(self.current_search)
+    self.files = self.current_search.getFiles()
     # Status
     self.files_results_limit = RESULT_LIMIT
     # Available tags and categories
     self.available_tags = []
+    self.available_tags_count = {}
     self.available_categories = [PseudoCategory('')]
     self.updateAvailableTags()
     self.updateAvailableCategories()
-    # Interface related
-    self.require_files_view_deferred_update = False
   
   def reloadConfig(self):
     self.root = self.ts.config['root']
     self.use_magnitude = self.ts.config['use_magnitude']
     self.show_folder_preview = self.ts.config['show_folder_preview']
+    self.pixbuf_cache.setMaxSize(self.ts.config['pixbuf_cache_size'] * 1024 * 1024)
   
   def _importUsedTags(self, old_used_tags):
     for tag in old_used_tags:
@@ -337,16 +510,27 @@ class Browser(BasicInterface):
   
   def updateFilesStore(self):
     self.log.info("updateFilesStore == Update Files store")
+    # NOTE: the pending pixbufs of the old rows are discarded
+    self.files_store_generation += 1
+    self.files_store_rows = {}
     self.files_store.clear()
-    for single_file in self.files:
-      if len(self.files_store) == self.files_results_limit:
-        break
+    self.appendFilesToStore()
+  
+  def appendFilesToStore(self):
+    # Add the files up to the results limit with a placeholder icon,
+    # the thumbnails are loaded in background
+    start = len(self.files_store)
+    new_files = list(self.files[start:self.files_results_limit])
+    for single_file in new_files:
+      # use the last decoded thumbnail if any, the workers check if it is still valid
+      cached = self.pixbuf_cache.get((single_file.getCode(), ICON_SIZE*2))
+      if cached is not None:
+        file_pixbuf = cached[1]
       else:
-        file_pixbuf = self.getFilePixbuf(single_file)
-        self.files_store.append([single_file.getCode(), single_file.getName(), file_pixbuf])
-    if self.require_files_view_deferred_update:
-      self.require_files_view_deferred_update = False
-      self.triggerFilesViewUpdate(True)
+        file_pixbuf = self.getFileIconPixbuf(single_file)
+      treeiter = self.files_store.append([single_file.getCode(), single_file.getName(), file_pixbuf])
+      self.files_store_rows[single_file.getCode()] = treeiter
+    self.loadFilesPixbufs(new_files, start)
   
   ##################
   ## Start / Stop ##
@@ -359,6 +543,11 @@ class Browser(BasicInterface):
   
   def close(self, *args):
     self.main_window.hide()
+    self.ts.thumb_manager.removeThumbnailListener(self.onThumbnailReady)
+    self.pixbuf_executor.shutdown(wait=False, cancel_futures=True)
+    self.name_search_debounce.cancel()
+    self.tags_filter_debounce.cancel()
+    self.search_scheduler.close()
     self.ts.close()
   
   ###################
@@ -378,16 +567,10 @@ class Browser(BasicInterface):
     self.log.info('reloadMainWindow == Start')
     # re-set the variables
     old_used_tags = self.used_tags.copy()
-    self.initializeVariables(old_used_tags)
+    self.initializeVariables(old_used_tags, self.getNameContains(), self.getQuery())
     # re-create the tags grid
     self.createTagsGrid()
-    # name contains
-    name_entry = self.builder.get_object('BrowserSearchName')
-    name_contains = name_entry.get_text().strip()
-    if name_contains == '':
-      name_contains = None
-    # find the files
-    self.files = self.db.getFilesWithTags(self.used_tags, self.use_magnitude, name_contains=name_contains)
+    # show the files
     self.updateFilesStore()
     # reload the interface
     self.updateCategorySelector()
@@ -401,13 +584,19 @@ class Browser(BasicInterface):
     self.tags_grids = {}
     for tag in self.tags:
       tag_button = Gtk.LinkButton()
-      tag_name = self.limitNameLenght(tag.getName())
-      tag_button.set_label(tag_name)
+      tag_button.set_label(self.getTagLabel(tag))
       tag_button.set_size_request(160, 0)
       tag_button.connect("activate-link", self.shandler.addTagInSearch, tag)
       tags_grid.add(tag_button)
       self.tags_grids[tag] = tag_button
   
+  def getTagLabel(self, tag):
+    label = self.limitNameLenght(tag.getName())
+    if tag.getCode() in self.available_tags_count:
+      # number of files of the current search with this tag
+      label += ' (' + str(self.available_tags_count[tag.getCode()]) + ')'
+    return label
+  
   def emptyContainer(self, cont):
     children = cont.get_children()
     for child in children:
@@ -435,11 +624,13 @@ class Browser(BasicInterface):
     self.log.info("updateTagsGrid == Start")
     tags_grid_is_empty = True
     search_term = self.tag_name_filter.get_text()
+    available_tags = set(self.available_tags)
     # show grid
     for tag in self.tags_grids:
       btn = self.tags_grids[tag]
       if (self.current_category is None or tag.getCategory() == self.current_category.getCode()) and \
-         tag in self.available_tags and search_term.lower() in tag.getName().lower():
+         tag in available_tags and search_term.lower() in tag.getName().lower():
+        btn.set_label(self.getTagLabel(tag))
         btn.show()
         tags_grid_is_empty = False
       else:
@@ -478,7 +669,8 @@ class Browser(BasicInterface):
       self.files_view.set_model(self.files_store)
     self.files_view.show_all()
     # show/hide the load more button
-    if len(self.files) > self.files_results_limit:
+    more_pages = self.current_search is not None and not self.current_search.isComplete()
+    if len(self.files) > self.files_results_limit or more_pages:
       self.load_more_files_button.show()
     else:
       self.load_more_files_button.hide()
@@ -494,7 +686,10 @@ class Browser(BasicInterface):
     pseudo_tag = PseudoTag("Untagged files")
     self.used_tags.append(pseudo_tag)
     # search files
-    self.files = self.db.getFilesWithNoTags()
+    self.name_search_debounce.cancel()
+    self.search_scheduler.cancel()
+    self.current_search = None
+    self.files = self.db.getFilesWithNoTags(columnar=True)
     self.updateFilesStore()
     # update interface
     # update the available tags
@@ -520,7 +715,16 @@ class Browser(BasicInterface):
     self.updateTagsGrid()
   
   def tagNameSearch(self, *args):
-    self.updateTagsGrid()
+    # NOTE: the grid is updated when the user stops typing
+    self.tags_filter_debounce()
+  
+  def changeName(self):
+    # NOTE: the search starts when the user stops typing
+    self.name_search_debounce()
+  
+  def changeQuery(self):
+    # NOTE: same type-ahead search of the name
+    self.name_search_debounce()
   
   def addTagInSearch(self, widget, tag):
     # clear the search form
@@ -545,14 +749,21 @@ class Browser(BasicInterface):
   def updateAvailableTags(self):
     # update available tags
     self.available_tags.clear()
+    self.available_tags_count = {}
     if len(self.used_tags) == 0:
       for tag in self.tags:
         self.available_tags.append(tag)
+      if self.current_search is not None:
+        _, name_contains, _, query = self.current_search.getKey()
+        if name_contains is None and query is None:
+          # all the files: the counts of the tags are known (see Database.getAllTags)
+          self.available_tags_count = {tag.getCode(): tag.getFilesCount() for tag in self.tags if tag.getFilesCount()}
     else:
-      valid_tags = self.db.getCommonTags(self.files)
-      valid_tags_codes = list(map(lambda t : int(t), valid_tags))
+      if self.current_search is not None:
+        # NOTE: the counts are loaded with the search (see runSearch)
+        self.available_tags_count = self.current_search.getTagsCounts()
       for tag in self.tags:
-        if tag.getCode() in valid_tags_codes and not tag in self.used_tags:
+        if tag.getCode() in self.available_tags_count and not tag in self.used_tags:
           self.available_tags.append(tag)
     
   def updateAvailableCategories(self):
@@ -571,11 +782,8 @@ class Browser(BasicInterface):
   ######################
   def openFile(self, widget, item):
     file_code = self.files_store[item][0]
-    single_file = None
-    for el_file in self.files:
-      if el_file.getCode() == file_code and self.ts.fileExists(el_file):
-        single_file = el_file
-    if single_file is not None:
+    single_file = self.files.getFileByCode(file_code)
+    if single_file is not None and self.ts.fileExists(single_file):
       # open file
       application = Popen(["xdg-open", self.ts.getFilePath(single_file)])
   
@@ -586,10 +794,9 @@ class Browser(BasicInterface):
     for ipath in path_list:
     #ipath = path_list[0]
       file_code = self.files_store[ipath][0]
-      #single_file = None
-      for el_file in self.files:
-        if el_file.getCode() == file_code and self.ts.fileExists(el_file):
-          files.append(el_file)
+      single_file = self.files.getFileByCode(file_code)
+      if single_file is not None and self.ts.fileExists(single_file):
+        files.append(single_file)
     if len(files) > 0:
       single_file = files[0]
       if single_file is not None:
@@ -606,10 +813,9 @@ class Browser(BasicInterface):
     for ipath in path_list:
     #ipath = path_list[0]
       file_code = self.files_store[ipath][0]
-      #single_file = None
-      for el_file in self.files:
-        if el_file.getCode() == file_code:
-          files.append(el_file)
+      single_file = self.files.getFileByCode(file_code)
+      if single_file is not None:
+        files.append(single_file)
     # ask for confirmation
     callback_success = self.removeFilesReal
     callback_failure = None
@@ -632,16 +838,37 @@ class Browser(BasicInterface):
   ## Search Files ##
   ##################
   def searchFiles(self):
-    # TODO: if I added a tag then search only among the self.files list
+    # NOTE: this search replaces the pending type-ahead one
+    self.name_search_debounce.cancel()
+    self.search_scheduler.cancel()
+    # search files
+    key = self.getSearchKey(self.getNameContains(), self.getQuery())
+    search = self.findSearch(key)
+    if search is None:
+      search = self.refineSearch(key)
+    if search is None:
+      search = self.runSearch(key, self.getTagsWeights(key))
+    self.showSearch(search)
+  
+  def searchFilesInBackground(self):
+    key = self.getSearchKey(self.getNameContains(), self.getQuery())
+    search = self.findSearch(key)
+    if search is None:
+      search = self.refineSearch(key)
+    if search is not None:
+      self.search_scheduler.cancel()
+      self.showSearch(search)
+    else:
+      # NOTE: the weights are loaded here, the main connection is not shared
+      weights = self.getTagsWeights(key)
+      self.search_scheduler.run(lambda db : self.runSearch(key, weights, db), self.showSearch)
+  
+  def showSearch(self, search):
     # restore the limit
     self.files_results_limit = RESULT_LIMIT
-    # name contains
-    name_entry = self.builder.get_object('BrowserSearchName')
-    name_contains = name_entry.get_text().strip()
-    if name_contains == '':
-      name_contains = None
-    # search files
-    self.files = self.db.getFilesWithTags(self.used_tags, self.use_magnitude, name_contains=name_contains)
+    self.current_search = search
+    self.pushSearch(search)
+    self.files = search.getFiles()
     self.updateFilesStore()
     # update the available tags
     self.updateAvailableTags()
@@ -651,45 +878,219 @@ class Browser(BasicInterface):
     self.updateUsedTagsView()
     self.updateFilesView()
 
+  def getNameContains(self):
+    name_entry = self.builder.get_object('BrowserSearchName')
+    name_contains = name_entry.get_text().strip()
+    if name_contains == '':
+      name_contains = None
+    return name_contains
+  
+  def getQuery(self):
+    # Return the tags query of the search bar (see TagQuery) or None if empty
+    # NOTE: a query not valid is ignored, the entry shows the error
+    query_entry = self.builder.get_object('BrowserSearchQuery')
+    text = query_entry.get_text().strip()
+    style = query_entry.get_style_context()
+    style.remove_class(Gtk.STYLE_CLASS_ERROR)
+    query_entry.set_tooltip_text(None)
+    if text == '':
+      return None
+    try:
+      query = TagQuery.parse(text)
+      self.db.resolveQuery(query)
+    except TagQuery.QueryError as error:
+      style.add_class(Gtk.STYLE_CLASS_ERROR)
+      query_entry.set_tooltip_text(str(error))
+      return None
+    return query
+  
+  def getSearchKey(self, name_contains, query=None):
+    tags_codes = frozenset(map(int, self.used_tags))
+    return (tags_codes, name_contains, self.use_magnitude, query)
+  
+  def getTagsWeights(self, key):
+    tags_codes, _, use_magnitude, _ = key
+    if not use_magnitude or len(tags_codes) == 0:
+      return None
+    return self.ts.getTagsWeights(tags_codes)
+  
+  def runSearch(self, key, weights=None, db=None):
+    # Load the first page of files
+    if db is None:
+      db = self.db
+    tags_codes, name_contains, use_magnitude, query = key
+    files, cursor = db.getFilesWithTagsPage(tags_codes, page_size=FILES_PAGE_SIZE, use_magnitude=use_magnitude, name_contains=name_contains, weights=weights, columnar=True, query=query)
+    tags_map = None
+    if len(tags_codes) > 0:
+      # load the tags of all the matching files to refine the search in memory
+      tags_map = db.getTagsOfFilesWithTags(tags_codes, name_contains=name_contains, query=query, limit=TAGS_MAP_LIMIT)
+    tags_counts = None
+    if len(tags_codes) > 0 and tags_map is None:
+      # too many files for the tags map, only the counts of the tags
+      tags_counts, _ = db.getTagsFacets(tags_codes, name_contains=name_contains, query=query)
+    return SearchResult(key, files, cursor, tags_map, tags_counts)
+  
+  def loadNextPage(self, search=None):
+    if search is None:
+      search = self.current_search
+    if search is None or search.isComplete():
+      return None
+    tags_codes, name_contains, use_magnitude, query = search.getKey()
+    files, cursor = self.db.getFilesWithTagsPage(tags_codes, cursor=search.getCursor(), page_size=FILES_PAGE_SIZE, use_magnitude=use_magnitude, name_contains=name_contains, weights=self.getTagsWeights(search.getKey()), columnar=True, query=query)
+    search.addPage(files, cursor)
+  
+  def findSearch(self, key):
+    # Search in the history (i.e. a tag has been removed)
+    for search in reversed(self.search_history):
+      if search.getKey() == key:
+        return search
+    return None
+  
+  def refineSearch(self, key):
+    # Filter the current result if tags have been added
+    search = self.current_search
+    if search is None or not search.hasTagsMap():
+      return None
+    old_tags, old_name_contains, old_use_magnitude, old_query = search.getKey()
+    used_tags, name_contains, use_magnitude, query = key
+    if old_name_contains != name_contains or old_use_magnitude != use_magnitude or old_query != query:
+      return None
+    if len(old_tags) == 0 or not old_tags < used_tags:
+      return None
+    if use_magnitude and not search.isComplete():
+      # NOTE: the added tags change the order, the cursor is not valid
+      return None
+    search = search.refine(key, used_tags - old_tags, use_magnitude, self.getTagsWeights(key))
+    while len(search.getFiles()) < min(RESULT_LIMIT, search.getTaggedFilesCount()) and not search.isComplete():
+      self.loadNextPage(search)
+    return search
+  
+  def pushSearch(self, search):
+    if search in self.search_history:
+      self.search_history.remove(search)
+    self.search_history.append(search)
+    if len(self.search_history) > SEARCH_HISTORY_SIZE:
+      self.search_history.pop(0)
+  
   def loadMoreImages(self):
     self.files_results_limit += RESULT_LIMIT
-    self.updateFilesStore()
+    if len(self.files) < self.files_results_limit:
+      # NOTE: self.files is the files list of the current search
+      self.loadNextPage()
+    self.appendFilesToStore()
     self.updateFilesView()
   
   #################################
   ## Icons/Thumbnails management ##
   #################################
-  def getFilePixbuf(self, single_file):
-    pixbuf = None
-    theme = Gtk.IconTheme.get_default()
+  def loadFilesPixbufs(self, files, first_row=0):
+    generation = self.files_store_generation
+    for index, single_file in enumerate(files):
+      # NOTE: the thumbnails of the first rows are created first
+      priority = ThumbManager.PRIORITY_VISIBLE + first_row + index
+      self.pixbuf_executor.submit(self._loadFilePixbuf, single_file, priority, generation)
+  
+  def _loadFilePixbuf(self, single_file, priority, generation):
+    # NOTE: runs on a pixbuf worker, do not touch the interface
+    if generation != self.files_store_generation:
+      return None
     if not self.ts.fileExists(single_file):
-      # missing file image
-      pixbuf = theme.load_icon(Gtk.STOCK_MISSING_IMAGE, ICON_SIZE, 0)
-      return pixbuf
-    # Check thumbnail
-    thumb_file = None
-    if single_file.getMime() != 'inode/directory' or self.ts.config['show_folder_preview']:
-      thumb_file = self.ts.thumb_manager.getThumbnail(single_file, ICON_SIZE*2)
-    if thumb_file is not None:
-      if thumb_file == 0: # Thumb is a work in progress
-        # defer update if thumb creator is still working...
-        self.require_files_view_deferred_update = True
+      result = PIXBUF_MISSING
+    else:
+      result = self._loadThumbnailPixbuf(single_file, priority)
+    if result is not None:
+      self._pushPixbufResult(generation, single_file.getCode(), result)
+  
+  def _loadThumbnailPixbuf(self, single_file, priority):
+    # Return the thumbnail pixbuf or None if there is no thumbnail (yet)
+    if single_file.getMime() == 'inode/directory' and not self.ts.config['show_folder_preview']:
+      return None
+    thumb_file = self.ts.thumb_manager.getThumbnail(single_file, ICON_SIZE*2, priority=priority)
+    if thumb_file is None or thumb_file == ThumbManager.RESULT_WORKING:
+      # NOTE: onThumbnailReady updates the row when the thumbnail is done
+      return None
+    return self._getThumbnailPixbuf(single_file.getCode(), thumb_file)
+  
+  def _getThumbnailPixbuf(self, code, thumb_file):
+    # Return the decoded thumbnail, decode it only if not in cache
+    try:
+      mtime = os.stat(thumb_file).st_mtime_ns
+    except OSError:
+      return None
+    key = (code, ICON_SIZE*2)
+    cached = self.pixbuf_cache.get(key)
+    if cached is not None and cached[0] == mtime:
+      return cached[1]
+    # Try loading the thumbnail
+    try:
+      pixbuf = Pixbuf.new_from_file(thumb_file)
+    except Exception:
+      return None
+    self.pixbuf_cache.put(key, (mtime, pixbuf))
+    return pixbuf
+  
+  def onThumbnailReady(self, single_file, icon_size, thumb_file):
+    # NOTE: called from a thumbnail worker
+    if thumb_file is None or icon_size != ICON_SIZE*2:
+      return None
+    generation = self.files_store_generation
+    self.pixbuf_executor.submit(self._loadReadyThumbnail, single_file.getCode(), thumb_file, generation)
+  
+  def _loadReadyThumbnail(self, code, thumb_file, generation):
+    if generation != self.files_store_generation:
+      return None
+    pixbuf = self._getThumbnailPixbuf(code, thumb_file)
+    if pixbuf is not None:
+      self._pushPixbufResult(generation, code, pixbuf)
+  
+  def _pushPixbufResult(self, generation, code, result):
+    with self.pixbuf_results_lock:
+      flush_scheduled = len(self.pixbuf_results) > 0
+      self.pixbuf_results.append((generation, code, result))
+    if not flush_scheduled:
+      GLib.idle_add(self._flushPixbufResults)
+  
+  def _flushPixbufResults(self):
+    # Update the rows with all the pixbufs loaded so far
+    with self.pixbuf_results_lock:
+      results = self.pixbuf_results
+      self.pixbuf_results = []
+    for generation, code, result in results:
+      if generation != self.files_store_generation or not code in self.files_store_rows:
+        continue
+      treeiter = self.files_store_rows[code]
+      if result == PIXBUF_MISSING:
+        # missing file image
+        self.files_store[treeiter][2] = self.getMissingIconPixbuf()
       else:
-        # Try loading the thumbnail
-        try:
-          pixbuf = Pixbuf.new_from_file(thumb_file)
-        except Exception:
-          pixbuf = None
-    if pixbuf is None:
-      # try to use the default icon if possible
-      # use a generic one otherwise
-      gtk_icon = self.getFileGtkIcon(single_file, theme)
-      try:
-        pixbuf = theme.load_icon(gtk_icon, ICON_SIZE, 0)
-      except Exception:
-        pixbuf = theme.load_icon(Gtk.STOCK_FILE, ICON_SIZE, 0)
+        self.files_store[treeiter][2] = result
+    return False # Stop idle
+  
+  def getFileIconPixbuf(self, single_file):
+    mime = single_file.getMime()
+    if mime in self.mime_icons:
+      return self.mime_icons[mime]
+    # try to use the default icon if possible
+    # use a generic one otherwise
+    theme = Gtk.IconTheme.get_default()
+    gtk_icon = self.getFileGtkIcon(single_file, theme)
+    try:
+      pixbuf = theme.load_icon(gtk_icon, ICON_SIZE, 0)
+    except Exception:
+      pixbuf = theme.load_icon(Gtk.STOCK_FILE, ICON_SIZE, 0)
+    self.mime_icons[mime] = pixbuf
     return pixbuf
   
+  def getMissingIconPixbuf(self):
+    # NOTE: None is not a valid mime
+    if not None in self.mime_icons:
+      theme = Gtk.IconTheme.get_default()
+      self.mime_icons[None] = theme.load_icon(Gtk.STOCK_MISSING_IMAGE, ICON_SIZE, 0)
+    return self.mime_icons[None]
+  
+  def onIconThemeChanged(self, *args):
+    self.mime_icons.clear()
+  
   def getFileGtkIcon(self, single_file, theme):  
     mime = single_file.getMime()
     # Mime icon
@@ -712,13 +1113,6 @@ class Browser(BasicInterface):
       return gtk_icon
     return Gtk.STOCK_FILE
   
-  def triggerFilesViewUpdate(self, trigger):
-    if trigger: 
-      timeout_id = GObject.timeout_add(1500, self.triggerFilesViewUpdate, False)
-    else:
-      self.updateFilesStore()
-      self.updateFilesView()
-  
   #####################
   ## Settings Window ##
   #####################
@@ -783,10 +1177,9 @@ class Browser(BasicInterface):
     for ipath in path_list:
     #ipath = path_list[0]
       file_code = self.files_store[ipath][0]
-      #single_file = None
-      for el_file in self.files:
-        if el_file.getCode() == file_code and self.ts.fileExists(el_file):
-          files.append(el_file)
+      single_file = self.files.getFileByCode(file_code)
+      if single_file is not None and self.ts.fileExists(single_file):
+        files.append(single_file)
     if len(files) > 0:
       self.ts.openBrowserTagFile(files)
   
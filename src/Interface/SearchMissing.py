@@ -1,10 +1,11 @@
 #!/usr/bin/env python3
 
 from gi.repository import Gtk
-from gi.repository import GObject
+from gi.repository import GLib
 
 from src.Constants import UI_FOLDER
 from src.Interface.Utils import BasicInterface
+from src import MissingScanner
 
 import os
 
@@ -31,6 +32,15 @@ class SearchMissing(BasicInterface):
   def __init__(self, *args, **kwargs):
     super().__init__(*args, **kwargs)
     self.browser = self.ts.browser
+    # NOTE: the scanner works in background, the results are added with idle_add
+    self.scanner = MissingScanner.start(self.ts)
+    # the results of an older scan (cancelled) are ignored
+    self.scan_generation = 0
+    self.searching = False
+    self.missing_files = {}
+    self.replace_entries = {}
+    self.search_keys = {}
+    self.moved_files = set()
     self._loadInterface()
  
   def _loadInterface(self):
@@ -44,6 +54,7 @@ class SearchMissing(BasicInterface):
     self.main_window = self.builder.get_object('SearchMissing')
     if self.browser is not None:
       self.main_window.set_transient_for(self.browser.main_window)
+    self.search_button = self.builder.get_object('SearchMissingSearchBtn')
   
   ## Start/Stop
   def start(self):
@@ -51,128 +62,134 @@ class SearchMissing(BasicInterface):
     self.main_window.show()
   
   def close(self):
+    self.cancelScan()
     self.main_window.hide()
     self.ts.closeSecondary(refresh=True)
   
   ## Update interface
   def updateInterface(self):
-    # find missing files
-    self.missing_files = self.findMissingFiles()
-    # hide completion
-    self.showCompletion(False)
-    if len(self.missing_files) > 0:
-      # setup results grid
-      self.setupResultsGrid()
-    else:
-      # show completion
-      self.showCompletion()
-      
-  def findMissingFiles(self):
-    # get all files
-    all_files = self.db.getAllFiles()
-    # search missing files
-    missing_files = {}
-    for single_file in all_files:
-      if not self.ts.fileExists(single_file):
-        missing_files[single_file] = None
-    return missing_files
-  
-  def setupResultsGrid(self):
-    # cleanup variables
-    self.replace_entries = {}
     # clean results grid
+    self.missing_files = {}
+    self.replace_entries = {}
     results_grid = self.builder.get_object('SearchMissingResults')
     children = results_grid.get_children()
     for child in children:
       child.destroy()
-    # write new grid
-    for single_file in self.missing_files:
-      # create the file grid
-      file_grid = Gtk.Grid()
-      file_grid.set_orientation(Gtk.Orientation.VERTICAL)
-      file_grid.set_row_spacing(3)
-      #file_grid.set_column_spacing(5)
-      file_grid.set_hexpand(True)
-      name_label = Gtk.Label(self.ts.getFilePath(single_file))
-      name_label.set_alignment(0, 0.5)
-      name_label.set_hexpand(True)
-      #name_label.set_selectable(True)
-      replace_entry = Gtk.Entry()
-      replace_entry.set_text(self.ts.getFilePath(single_file))
-      confirm_button = Gtk.Button('Replace')
-      confirm_button.connect('clicked', self.shandler.onAcceptReplace, [single_file, replace_entry, file_grid])
-      remove_button = Gtk.Button('Delete')
-      remove_button.connect('clicked', self.shandler.onAcceptRemove, [single_file, file_grid])
-      hseparator = Gtk.Separator()
-      hseparator.set_orientation(Gtk.Orientation.HORIZONTAL)
-      # buttons box
-      buttons_box = Gtk.Grid()
-      buttons_box.set_orientation(Gtk.Orientation.HORIZONTAL)
-      buttons_box.set_column_spacing(5)
-      buttons_box.add(confirm_button)
-      buttons_box.add(remove_button)
-      # file grid
-      file_grid.add(name_label)
-      file_grid.add(replace_entry)
-      file_grid.add(buttons_box)
-      file_grid.add(hseparator)
-      results_grid.add(file_grid)
-      # add to replace entries list
-      self.replace_entries[single_file] = replace_entry
+    # hide completion
+    self.showCompletion(False)
+    # find missing files (the search is enabled at the end)
+    self.search_button.set_sensitive(False)
+    all_files = self.db.getAllFiles(columnar=True)
+    generation = self.cancelScan()
+    on_missing = lambda files : GLib.idle_add(self.addMissingFiles, files, generation)
+    on_done = lambda cancelled : GLib.idle_add(self.onMissingFilesDone, cancelled, generation)
+    self.scanner.findMissing(all_files, on_missing, on_done)
+  
+  def cancelScan(self):
+    # Stop the running scan, return the generation of the next one
+    self.scanner.cancel()
+    self.scan_generation += 1
+    return self.scan_generation
+  
+  def addMissingFiles(self, files, generation):
+    if generation != self.scan_generation:
+      return False
+    results_grid = self.builder.get_object('SearchMissingResults')
+    for single_file in files:
+      self.missing_files[single_file] = None
+      self.addResultRow(results_grid, single_file)
     results_grid.show_all()
+    return False
+  
+  def onMissingFilesDone(self, cancelled, generation):
+    if generation != self.scan_generation:
+      return False
+    if not cancelled:
+      self.search_button.set_sensitive(True)
+      if len(self.missing_files) == 0:
+        self.showCompletion()
+    return False
+  
+  def addResultRow(self, results_grid, single_file):
+    # create the file grid
+    file_grid = Gtk.Grid()
+    file_grid.set_orientation(Gtk.Orientation.VERTICAL)
+    file_grid.set_row_spacing(3)
+    #file_grid.set_column_spacing(5)
+    file_grid.set_hexpand(True)
+    name_label = Gtk.Label(self.ts.getFilePath(single_file))
+    name_label.set_alignment(0, 0.5)
+    name_label.set_hexpand(True)
+    #name_label.set_selectable(True)
+    replace_entry = Gtk.Entry()
+    replace_entry.set_text(self.ts.getFilePath(single_file))
+    confirm_button = Gtk.Button('Replace')
+    confirm_button.connect('clicked', self.shandler.onAcceptReplace, [single_file, replace_entry, file_grid])
+    remove_button = Gtk.Button('Delete')
+    remove_button.connect('clicked', self.shandler.onAcceptRemove, [single_file, file_grid])
+    hseparator = Gtk.Separator()
+    hseparator.set_orientation(Gtk.Orientation.HORIZONTAL)
+    # buttons box
+    buttons_box = Gtk.Grid()
+    buttons_box.set_orientation(Gtk.Orientation.HORIZONTAL)
+    buttons_box.set_column_spacing(5)
+    buttons_box.add(confirm_button)
+    buttons_box.add(remove_button)
+    # file grid
+    file_grid.add(name_label)
+    file_grid.add(replace_entry)
+    file_grid.add(buttons_box)
+    file_grid.add(hseparator)
+    results_grid.add(file_grid)
+    # add to replace entries list
+    self.replace_entries[single_file] = replace_entry
   
   def startSearch(self):
-    # show searching message
-    sw = Gtk.Window(title="Searching")
-    sw.set_transient_for(self.main_window)
-    sw.set_position(Gtk.WindowPosition.CENTER_ON_PARENT)
-    sw.set_modal(True)
-    sw.set_border_width(10)
-    sw.set_default_size(100, 100)
-    label = Gtk.Label('Searching')
-    label.set_alignment(0.5, 0.5)
-    label.set_hexpand(True)
-    label.set_vexpand(True)
-    sw.add(label)
-    sw.show_all()
-    # start timeout
-    GObject.timeout_add(100, self.startSearchTimeout, sw)
-  
-  def startSearchTimeout(self, sw):
-    self.searchFileIn(self.browser.root)
-    self.updateResultsGrid()
-    sw.destroy()
-    return False # Stop timeout
-  
-  def searchFileIn(self, root):
-    search_list = {}
-    for single_file in self.missing_files:
-      search_list[single_file.getName().lower()] = single_file
-    for base, dirs, files in os.walk(root): # add a followlinks=True?
-      # check file names
-      for filename in files:
-        # check file
-        if filename.lower() in search_list:
-          filepath = os.path.join(base, filename)
-          single_file = search_list[filename.lower()]
-          self.missing_files[single_file] = filepath
-      # check folders and ignore folders starting with .
-      for single_dir in dirs:
-        # check folder
-        if single_dir.lower() in search_list:
-          filepath = os.path.join(base, single_dir)
-          single_file = search_list[single_dir.lower()]
-          self.missing_files[single_file] = filepath
-        # check if I should ignore
-        if single_dir.startswith("."):
-          dirs.remove(single_dir)
-    
-  def updateResultsGrid(self):
+    # the button stops a running search
+    if self.searching:
+      self.cancelScan()
+      self.onSearchDone(True, self.scan_generation)
+      return
+    self.searching = True
+    self.search_button.set_label('Stop search')
+    # files to search by name and by content
+    self.search_keys = {}
+    self.moved_files = set()
+    fingerprints = self.db.getFingerprintsOfFiles(self.missing_files.keys())
     for single_file in self.missing_files:
-      replace_path = self.missing_files[single_file]
-      if replace_path is not None:
-        replace_entry = self.replace_entries[single_file]
-        replace_entry.set_text(replace_path)
+      keys = [(MissingScanner.MATCH_NAME, single_file.getName().lower())]
+      if single_file.getCode() in fingerprints:
+        keys.append((MissingScanner.MATCH_FINGERPRINT, fingerprints[single_file.getCode()]))
+      for key in keys:
+        if not key in self.search_keys:
+          self.search_keys[key] = []
+        self.search_keys[key].append(single_file)
+    names = [key for match_type, key in self.search_keys if match_type == MissingScanner.MATCH_NAME]
+    generation = self.cancelScan()
+    on_match = lambda matches : GLib.idle_add(self.updateResultsGrid, matches, generation)
+    on_done = lambda cancelled : GLib.idle_add(self.onSearchDone, cancelled, generation)
+    self.scanner.searchFiles(self.ts.config['root'], names, set(fingerprints.values()), on_match, on_done)
+  
+  def onSearchDone(self, cancelled, generation):
+    if generation != self.scan_generation:
+      return False
+    self.searching = False
+    self.search_button.set_label('Search in root')
+    return False
+  
+  def updateResultsGrid(self, matches, generation):
+    # NOTE: a match by content wins over a match by name
+    if generation != self.scan_generation:
+      return False
+    for match_type, key, replace_path in matches:
+      for single_file in self.search_keys.get((match_type, key), []):
+        if not single_file in self.missing_files or single_file in self.moved_files:
+          continue
+        if match_type == MissingScanner.MATCH_FINGERPRINT:
+          self.moved_files.add(single_file)
+        self.missing_files[single_file] = replace_path
+        self.replace_entries[single_file].set_text(replace_path)
+    return False
   
   def onAcceptReplace(self, widget, data):
     # update database
@@ -94,14 +94,12 @@ class TagFile(BasicInterface):
     self.current_category = self.categories[0]
     # Load item tags
     self.items_tags = {}
+    tags_by_code = {tag.getCode(): tag for tag in self.tags}
+    files_tags = self.db.getTagsOfFiles(self.files)
     for single_file in self.files:
-      single_item_tags = {}
       # set active tags
-      magn, _ = self.db.getTagsOfFile(single_file)
-      for tag in self.tags:
-        if tag.getCode() in magn.keys():
-          single_item_tags[tag] = magn[tag.getCode()]
-      self.items_tags[single_file] = single_item_tags
+      magn = files_tags[single_file.getCode()]
+      self.items_tags[single_file] = {tags_by_code[code]: magnitude for code, magnitude in magn.items() if code in tags_by_code}
   
   @ignoreSignals
   def _loadInterface(self):
@@ -140,15 +138,9 @@ class TagFile(BasicInterface):
   ## Load Files ##
   ################
   def _loadFiles(self, filepaths):
-    self.files = []
-    for filepath in filepaths:
-      tfile = self.ts.getFileByPath(filepath)
-      if tfile is None:
-        self.log.info("_loadFiles == Add file to database:" + filepath)
-        # add to database
-        tfile = self.ts.loadFile(filepath)
-        self.db.addFile(tfile)
-      self.files.append(tfile)
+    # NOTE: the new files are added to the database
+    self.files = self.ts.registerFiles(filepaths)
+    self.log.info("_loadFiles == Loaded " + str(len(self.files)) + " files")
   
   ########################
   ## Interface creation ##
@@ -431,22 +423,23 @@ class TagFile(BasicInterface):
   
   def toggleTag(self, tag, status=True):
     if tag is not None:
+      changed_files = []
       if status:
         for single_file in self.files:
           item_tags = self.items_tags[single_file]
           if tag in item_tags and item_tags[tag] == 1:
             pass
           else:
-            self.db.addTagToFile(tag, single_file, 1, commit=False)
+            changed_files.append(single_file)
             self.items_tags[single_file][tag] = 1
+        self.db.addTagToFiles(tag, changed_files, 1)
       else:
         for single_file in self.files:
           item_tags = self.items_tags[single_file]
           if tag in item_tags and item_tags[tag] == 1:
-            self.db.removeTagFromFile(tag, single_file, commit=False)
+            changed_files.append(single_file)
             self.items_tags[single_file][tag] = 0
-      # Commit changes to db
-      self.db.commit()
+        self.db.removeTagFromFiles(tag, changed_files)
     return True
         
   ##########################
@@ -456,23 +449,20 @@ class TagFile(BasicInterface):
     tag = data[0]
     magnitude = data[1]
     if magnitude == 0:
+      changed_files = []
       for single_file in self.files:
         tags_magnitude = self.items_tags[single_file]
         if tag in tags_magnitude and tags_magnitude[tag] > 0:
-          self.db.removeTagFromFile(tag, single_file, commit=False)
+          changed_files.append(single_file)
           self.items_tags[single_file][tag] = 0
         else:
           pass
+      self.db.removeTagFromFiles(tag, changed_files)
     else:
+      # NOTE: the files which already have the tag get the new magnitude
+      self.db.addTagToFiles(tag, self.files, magnitude)
       for single_file in self.files:
-        tags_magnitude = self.items_tags[single_file]
-        if tag in tags_magnitude and tags_magnitude[tag] > 0:
-          self.db.changeTagMagnitudeForFile(tag, single_file, magnitude, commit=False)
-        else:
-          self.db.addTagToFile(tag, single_file, magnitude, commit=False)
         self.items_tags[single_file][tag] = magnitude
-    # Commit changes
-    self.db.commit()
     return True
   
   ######################
@@ -508,9 +498,7 @@ class TagFile(BasicInterface):
       self.showErrorWindow("Duplicate name")
       return None
     # add tag to the files
-    for single_file in self.files:
-      self.db.addTagToFile(new_tag, single_file, magnitude=1, commit=False)
-    self.db.commit()
+    self.db.addTagToFiles(new_tag, self.files, magnitude=1)
     self.showInfoWindow("Tag created")
     self.reloadMainWindow(new_tag.getCategory())
   
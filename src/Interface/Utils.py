@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 from gi.repository import Gtk
+from gi.repository import GLib
 
 def acceptInterfaceSignals(method):
   def new(self, *args, **kwargs):
@@ -22,6 +23,29 @@ def ignoreSignals(method):
   return new
 
 
+class Debounce():
+  # Call the callback on the main loop once no call has been made for delay ms
+  
+  def __init__(self, delay, callback):
+    self.delay = delay
+    self.callback = callback
+    self.timeout_id = None
+  
+  def __call__(self, *args):
+    self.cancel()
+    self.timeout_id = GLib.timeout_add(self.delay, self._onTimeout, *args)
+  
+  def cancel(self):
+    if self.timeout_id is not None:
+      GLib.source_remove(self.timeout_id)
+      self.timeout_id = None
+  
+  def _onTimeout(self, *args):
+    self.timeout_id = None
+    self.callback(*args)
+    return False
+
+
 class BasicInterface():
   
   def __init__(self, ts):
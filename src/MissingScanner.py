@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import FIRST_COMPLETED
+from concurrent.futures import wait
+
+from src.Utils.Fingerprint import getFingerprint
+from src.Utils.Fingerprint import getFingerprintSize
+
+SCAN_WORKERS = 16
+EXISTS_CHUNK_SIZE = 256
+
+MATCH_NAME = 'name'
+MATCH_FINGERPRINT = 'fingerprint'
+
+#####################
+## Missing Scanner ##
+#####################
+
+class MissingScanner():
+  # Find the missing files and look for them under a folder on background threads.
+  # NOTE: the callbacks are called from the scanner threads
+  
+  def __init__(self, profile, workers=SCAN_WORKERS):
+    self.profile = profile
+    self.workers = workers
+    self.cancelled = threading.Event()
+  
+  def cancel(self):
+    self.cancelled.set()
+  
+  def _start(self, target, *args):
+    self.cancel()
+    self.cancelled = threading.Event()
+    thread = threading.Thread(target=target, args=(self.cancelled, ) + args, daemon=True)
+    thread.start()
+  
+  ## Missing files
+  def findMissing(self, files, on_missing, on_done):
+    # Call on_missing(files) with each chunk of missing files and on_done(cancelled) at the end
+    # NOTE: files is a list or a FileList, the File objects are created chunk by chunk
+    self._start(self._findMissing, files, on_missing, on_done)
+  
+  def _findMissing(self, cancelled, files, on_missing, on_done):
+    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+      for start in range(0, len(files), EXISTS_CHUNK_SIZE):
+        if cancelled.is_set():
+          break
+        chunk = list(files[start:start + EXISTS_CHUNK_SIZE])
+        exists = executor.map(self.profile.fileExists, chunk)
+        missing = [single_file for single_file, found in zip(chunk, exists) if not found]
+        if len(missing) > 0 and not cancelled.is_set():
+          on_missing(missing)
+    on_done(cancelled.is_set())
+  
+  ## Search
+  def searchFiles(self, root, names, fingerprints, on_match, on_done):
+    # Walk root once looking for files or folders with the given names (lower case)
+    # and for files with the given fingerprints, call on_match([(match_type, key, path)])
+    # with the matches of each folder and on_done(cancelled) at the end
+    # NOTE: the folders starting with . are not visited
+    # NOTE: only the files with the size of a fingerprint are hashed
+    sizes = set(map(getFingerprintSize, fingerprints))
+    self._start(self._searchFiles, root, set(names), set(fingerprints), sizes, on_match, on_done)
+  
+  def _searchFiles(self, cancelled, root, names, fingerprints, sizes, on_match, on_done):
+    search = (names, fingerprints, sizes, on_match)
+    with ThreadPoolExecutor(max_workers=self.workers) as executor:
+      pending = {executor.submit(self._scanFolder, cancelled, root, *search)}
+      while len(pending) > 0:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+          for folder in future.result():
+            pending.add(executor.submit(self._scanFolder, cancelled, folder, *search))
+    on_done(cancelled.is_set())
+  
+  def _scanFolder(self, cancelled, folder, names, fingerprints, sizes, on_match):
+    # Return the subfolders to visit
+    if cancelled.is_set():
+      return []
+    matches = []
+    subfolders = []
+    try:
+      with os.scandir(folder) as entries:
+        for entry in entries:
+          name = entry.name.lower()
+          if name in names:
+            matches.append((MATCH_NAME, name, entry.path))
+          if entry.is_dir(follow_symlinks=False):
+            if not entry.name.startswith('.'):
+              subfolders.append(entry.path)
+          elif entry.is_file(follow_symlinks=False) and entry.stat(follow_symlinks=False).st_size in sizes:
+            fingerprint = getFingerprint(entry.path)
+            if fingerprint in fingerprints:
+              matches.append((MATCH_FINGERPRINT, fingerprint, entry.path))
+    except OSError:
+      return []
+    if len(matches) > 0 and not cancelled.is_set():
+      on_match(matches)
+    return subfolders
+
+def start(*args, **kwargs):
+  scanner = MissingScanner(*args, **kwargs)
+  return scanner
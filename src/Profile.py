@@ -3,6 +3,7 @@
 import os
 
 from src.Common import loadFile
+from src.Common import loadFiles
 from src.Common import Configurable
 from src import Database
 from src import ThumbManager
@@ -16,20 +17,45 @@ class Profile(Configurable):
   def __init__(self, *args, **kwargs):
     super().__init__(*args, **kwargs)
     db_path = os.path.join(self.config_folder, 'tf.db')
-    self.db = Database.start(db_path)
+    self.db = self.openDatabase(db_path, tags_index=True)
     self.thumb_manager = ThumbManager.start(self)
   
+  def openDatabase(self, db_path, tags_index=False):
+    # NOTE: the tags index is only loaded by the connections used for the searches
+    db = Database.start(db_path)
+    if tags_index and self.config['tags_index']:
+      db.loadTagsIndex()
+    return db
+  
+  def reloadConfig(self):
+    super().reloadConfig()
+    # the thumbnails settings depend on the config
+    self.thumb_manager.reloadConfig()
+  
   def loadDefaultConfig(self):
     config = {}
     config['root'] = os.path.join(os.environ['HOME'], 'TagSearch/')
     config['use_magnitude'] = False
+    config['tags_weights'] = {} # {tag_code: weight} used with the magnitude
+    config['categories_weights'] = {} # {category_code: weight}
     config['show_folder_preview'] = False
     config['thumb_filetype'] = 'png'
+    config['thumb_workers'] = os.cpu_count() or 2
+    config['pixbuf_cache_size'] = 64 # MB
+    config['watch_root'] = False # needs inotify_simple
+    config['tags_index'] = False # keep the files of each tag in memory
     return config
   
   def close(self):
+    self.thumb_manager.close()
     self.db.close()
   
+  def getTagsWeights(self, tags):
+    # Return the weights to order by magnitude or None if all of them are 1
+    if not self.config['tags_weights'] and not self.config['categories_weights']:
+      return None
+    return self.db.getTagsWeights(tags, self.config['tags_weights'], self.config['categories_weights'])
+  
   def getProfileName(self):
     return os.path.basename(self.config_folder)
   
@@ -39,6 +65,27 @@ class Profile(Configurable):
   def loadFile(self, path):
     return loadFile(path, self.config['root'])
   
+  def loadFiles(self, paths):
+    return loadFiles(paths, self.config['root'])
+  
+  def registerFiles(self, paths):
+    # Return the files of the paths, the new ones are added to the database
+    # in a single transaction (out of tree and missing files are skipped)
+    relpaths = []
+    for path in paths:
+      path = os.path.abspath(path)
+      if path.startswith(self.config['root']):
+        relpaths.append(os.path.relpath(path, self.config['root']))
+    relpaths = list(dict.fromkeys(relpaths))
+    known = self.db.getFilesByRelativePaths(relpaths)
+    missing = [self.getCompletePath(relpath) for relpath in relpaths if not relpath in known]
+    new_files = self.loadFiles(missing)
+    codes = self.db.addFiles(new_files)
+    for new_file, code in zip(new_files, codes):
+      if code is not None:
+        known[new_file.getPath()] = new_file
+    return [known[relpath] for relpath in relpaths if relpath in known]
+  
   def getFilePath(self, tfile):
     return self.getCompletePath(tfile.getPath())
   
@@ -1,12 +1,14 @@
 #!/usr/bin/env python3
 
-import os
+import threading
 
 from urllib import parse
 
+from src import TMWebPool
 from src import TMWebManager
+from src import TagQuery
+from src.Common import json_loads
 from src.Common import json_dumps
-from src.Common import getConfigFolder
 
 OPERATION_GET_TAGS = 'get_tags'
 OPERATION_GET_FILES = 'get_files'
@@ -22,11 +24,15 @@ KEY_CODE = 'code'
 KEY_CODE_TAG = 'code_tag'
 KEY_NAME_CONTAINS = 'name_contains'
 KEY_LIMIT = 'limit'
+KEY_PAGE_SIZE = 'page_size'
+KEY_CURSOR = 'cursor'
+KEY_QUERY = 'query'
 
 RESULT_OK = {"success": True}
 RESULT_ERROR = {"success": False}
 RESULT_ERROR_OPERATION = {"success": False, "error" : "Operation unknown"}
 RESULT_ERROR_MISSING_ARGUMENTS = {"success": False, "error" : "Missing arguments"}
+RESULT_ERROR_INVALID_ARGUMENTS = {"success": False, "error" : "Invalid arguments"}
 
 ## Decorators
 def returnJson(method):
@@ -45,26 +51,49 @@ def requireData(data_keys):
     return new
   return decorator
 
+## Request state (one per server thread)
+
+class RequestState(threading.local):
+  
+  def __init__(self):
+    self.data = []
+    self.manager = None
+
 ## TMWeb class
 
 class TMWeb():
   
-  def __init__(self, profile):
+  def __init__(self, profile, pool_size=TMWebPool.POOL_SIZE):
     self.profile = profile
-    self.data = []
-    self.manager = None
+    self.pool = TMWebPool.start(pool_size)
+    self.request = RequestState()
+  
+  @property
+  def data(self):
+    return self.request.data
+  
+  @data.setter
+  def data(self, data):
+    self.request.data = data
+  
+  @property
+  def manager(self):
+    return self.request.manager
+  
+  @manager.setter
+  def manager(self, manager):
+    self.request.manager = manager
   
   def startManager(self, profile):
-    config_folder = getConfigFolder(profile)
-    if not os.path.exists(config_folder):
-      self.manager = None
-    else:
-      self.manager = TMWebManager.start(config_folder)
+    self.manager = self.pool.acquire(profile)
   
   def stopManager(self):
-    self.manager.close()
+    self.pool.release(self.manager)
     self.manager = None
   
+  def close(self):
+    self.pool.close()
+  
   ## Utils ##
   def dataUnquote(self, string):
     return parse.unquote(string)
@@ -88,8 +117,10 @@ class TMWeb():
     self.startManager(profile)
     if self.manager is None:
       return RESULT_ERROR
-    result = self.executeOperation(operation)
-    self.stopManager()
+    try:
+      result = self.executeOperation(operation)
+    finally:
+      self.stopManager()
     return result
   
   def getOperation(self):
@@ -124,9 +155,11 @@ class TMWeb():
   def getTags(self):
     return self.manager.getTags()
   
-  @requireData([KEY_TAGS])
+  # NOTE: tags can be omitted if there is a query (see TagQuery)
   def getFiles(self):
-    tag_list = self.data[KEY_TAGS]
+    if not KEY_TAGS in self.data and not self.requestData([KEY_QUERY]):
+      return RESULT_ERROR_MISSING_ARGUMENTS
+    tag_list = self.data.get(KEY_TAGS, '')
     if len(tag_list) == 0:
       tags = []
     else:
@@ -134,27 +167,61 @@ class TMWeb():
     name_contains = None
     if KEY_NAME_CONTAINS in self.data:
       name_contains = self.dataUnquote(self.data[KEY_NAME_CONTAINS])
-    return self.manager.getFilesAndTagsWith(tags, name_contains)
+    try:
+      query = None
+      if self.requestData([KEY_QUERY]):
+        query = TagQuery.parse(self.dataUnquote(self.data[KEY_QUERY]))
+      if KEY_PAGE_SIZE in self.data or KEY_CURSOR in self.data:
+        return self.getFilesPage(tags, name_contains, query)
+      return self.manager.getFilesAndTagsWith(tags, name_contains, query)
+    except TagQuery.QueryError as error:
+      return {"success": False, "error" : "Invalid query: " + str(error)}
+  
+  def getFilesPage(self, tags, name_contains, query=None):
+    # NOTE: the cursor is the opaque string returned by the previous page
+    cursor = None
+    page_size = TMWebManager.PAGE_SIZE
+    try:
+      if self.requestData([KEY_CURSOR]):
+        cursor = json_loads(self.dataUnquote(self.data[KEY_CURSOR]))
+      if self.requestData([KEY_PAGE_SIZE]):
+        page_size = int(self.data[KEY_PAGE_SIZE])
+    except ValueError:
+      return RESULT_ERROR_INVALID_ARGUMENTS
+    if page_size <= 0 or (cursor is not None and not isValidCursor(cursor)):
+      return RESULT_ERROR_INVALID_ARGUMENTS
+    return self.manager.getFilesPageWith(tags, name_contains, cursor, page_size, query)
   
   @requireData([KEY_CODE])
   def getFileWithTags(self):
     code = self.data[KEY_CODE]
     return self.manager.getFileWithTags(code)
   
+  # NOTE: code can be a comma separated list of files codes
   @requireData([KEY_CODE, KEY_CODE_TAG])
   def addTagToFile(self):
-    fcode = self.data[KEY_CODE]
+    fcodes = self.getCodesList(self.data[KEY_CODE])
     tcode = self.data[KEY_CODE_TAG]
-    self.manager.addTagToFile(tcode, fcode)
+    if fcodes is None:
+      return RESULT_ERROR_INVALID_ARGUMENTS
+    self.manager.addTagToFiles(tcode, fcodes)
     return RESULT_OK
   
   @requireData([KEY_CODE, KEY_CODE_TAG])
   def removeTagFromFile(self):
-    fcode = self.data[KEY_CODE]
+    fcodes = self.getCodesList(self.data[KEY_CODE])
     tcode = self.data[KEY_CODE_TAG]
-    self.manager.removeTagFromFile(tcode, fcode)
+    if fcodes is None:
+      return RESULT_ERROR_INVALID_ARGUMENTS
+    self.manager.removeTagFromFiles(tcode, fcodes)
     return RESULT_OK
   
+  def getCodesList(self, codes):
+    try:
+      return list( map(int, codes.split(',')) )
+    except ValueError:
+      return None
+  
   @requireData([KEY_CODE, KEY_CODE_TAG])
   def toggleTagForFile(self):
     fcode = self.data[KEY_CODE]
@@ -162,6 +229,15 @@ class TMWeb():
     self.manager.toggleTagForFile(tcode, fcode)
     return RESULT_OK
     
-def start(config_folder):
-  aw = TMWeb(config_folder)
+def isValidCursor(cursor):
+  # The cursor of a page is [name or magnitude, file code] (see Database.getFilesWithTagsPage)
+  if not isinstance(cursor, list) or len(cursor) != 2:
+    return False
+  key, code = cursor
+  if isinstance(key, bool) or not isinstance(key, (str, int, float)):
+    return False
+  return isinstance(code, int) and not isinstance(code, bool)
+
+def start(*args, **kwargs):
+  aw = TMWeb(*args, **kwargs)
   return aw
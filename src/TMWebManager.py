@@ -2,8 +2,12 @@
 
 import os
 
+from src import Database
+from src.Common import json_dumps
 from src.Profile import Profile
 
+PAGE_SIZE = Database.PAGE_SIZE
+
 class TMWebManager(Profile):
   
   def __init__(self, *args, **kwargs):
@@ -12,6 +16,15 @@ class TMWebManager(Profile):
     self.web_folder = 'archive/' + self.getProfileName()
     self.web_thumbs_folder = 'thumbs/' + self.getProfileName()
   
+  def openDatabase(self, db_path, tags_index=False):
+    # NOTE: the managers are shared between the server threads (one at a time)
+    # NOTE: each manager of the pool loads its own tags index (and ThumbManager),
+    #       the memory of the index is multiplied by TMWebPool.POOL_SIZE
+    db = Database.start(db_path, check_same_thread=False)
+    if tags_index and self.config['tags_index']:
+      db.loadTagsIndex()
+    return db
+  
   def getFileHref(self, tfile):
     return os.path.join(self.web_folder, tfile.getPath())
   
@@ -24,6 +37,11 @@ class TMWebManager(Profile):
     res['thumb'] = self.getFileThumb(tfile)
     return res
   
+  def convertTagToDict(self, tag, counts):
+    res = tag.toArray()
+    res['count'] = counts[tag.getCode()]
+    return res
+  
   def getTags(self):
     # Categories
     categories = self.db.getAllCategories()
@@ -39,18 +57,33 @@ class TMWebManager(Profile):
     result = {'tags' : tag_list, 'categories' : cat_list}
     return result
   
-  def getFilesAndTagsWith(self, tags_codes, name_contains=None):
+  def getFilesAndTagsWith(self, tags_codes, name_contains=None, query=None):
     # Files
-    files = self.db.getFilesWithTags(tags_codes, name_contains=name_contains)
+    files = self.db.getFilesWithTags(tags_codes, name_contains=name_contains, columnar=True, query=query)
     file_list = list( map(self.convertFileToDict, files) )
     # Tags
-    tag_list = []
-    tags = self.db.getCommonTags(files)
-    tag_list = list( map(lambda t : t.toArray(), tags) )
+    counts, tags = self.db.getTagsFacets(tags_codes, name_contains=name_contains, query=query)
+    tag_list = list( map(lambda t : self.convertTagToDict(t, counts), tags) )
     # Result
     result = {'tags' : tag_list, 'files' : file_list}
     return result
   
+  def getFilesPageWith(self, tags_codes, name_contains=None, cursor=None, page_size=PAGE_SIZE, query=None):
+    # Files
+    files, next_cursor = self.db.getFilesWithTagsPage(tags_codes, cursor=cursor, page_size=page_size, name_contains=name_contains, query=query)
+    file_list = list( map(self.convertFileToDict, files) )
+    # Result
+    result = {'files' : file_list}
+    if next_cursor is None:
+      result['cursor'] = None
+    else:
+      result['cursor'] = json_dumps(next_cursor)
+    if cursor is None:
+      # Tags (first page only, they are the same for all the pages)
+      counts, tags = self.db.getTagsFacets(tags_codes, name_contains=name_contains, query=query)
+      result['tags'] = list( map(lambda t : self.convertTagToDict(t, counts), tags) )
+    return result
+  
   def getFileWithTags(self, fcode):
     tfile = self.db.getFileByCode(fcode)
     if tfile is None:
@@ -70,6 +103,14 @@ class TMWebManager(Profile):
     self.db.removeTagFromFile(tcode, fcode) 
     return True
   
+  def addTagToFiles(self, tcode, fcodes):
+    self.db.addTagToFiles(tcode, fcodes)
+    return True
+  
+  def removeTagFromFiles(self, tcode, fcodes):
+    self.db.removeTagFromFiles(tcode, fcodes)
+    return True
+  
   def toggleTagForFile(self, tcode, fcode):
     manitude, tags = self.db.getTagsOfFile(fcode)
     tags_codes = list( map(int, tags) )
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+
+import os
+import queue
+import threading
+
+from src import TMWebManager
+from src.Common import getConfigFolder
+
+POOL_SIZE = 4
+
+##################
+## Manager Pool ##
+##################
+
+class ManagerPool():
+  # Long-lived managers (each with its own database connection) of a profile
+  
+  def __init__(self, config_folder, size=POOL_SIZE):
+    self.config_folder = config_folder
+    self.size = size
+    self.idle = queue.LifoQueue()
+    self.created = 0
+    self.lock = threading.Lock()
+  
+  def acquire(self):
+    try:
+      manager = self.idle.get_nowait()
+    except queue.Empty:
+      manager = self._createManager()
+    if manager.configChanged():
+      manager.reloadConfig()
+    return manager
+  
+  def release(self, manager):
+    # discard any uncommitted change
+    manager.getDatabase().rollback()
+    self.idle.put(manager)
+  
+  def _createManager(self):
+    with self.lock:
+      create = self.created < self.size
+      if create:
+        self.created += 1
+    if not create:
+      # wait for a manager to be released
+      return self.idle.get()
+    try:
+      return TMWebManager.start(self.config_folder)
+    except Exception:
+      with self.lock:
+        self.created -= 1
+      raise
+  
+  def close(self):
+    while True:
+      try:
+        manager = self.idle.get_nowait()
+      except queue.Empty:
+        break
+      manager.close()
+      with self.lock:
+        self.created -= 1
+
+################
+## TMWeb Pool ##
+################
+
+class TMWebPool():
+
+  def __init__(self, size=POOL_SIZE):
+    self.size = size
+    self.pools = {}
+    self.lock = threading.Lock()
+  
+  def getPool(self, profile):
+    with self.lock:
+      if not profile in self.pools:
+        config_folder = getConfigFolder(profile)
+        if not os.path.exists(config_folder):
+          return None
+        self.pools[profile] = ManagerPool(config_folder, self.size)
+      return self.pools[profile]
+  
+  def acquire(self, profile):
+    pool = self.getPool(profile)
+    if pool is None:
+      return None
+    else:
+      return pool.acquire()
+  
+  def release(self, manager):
+    pool = self.getPool(manager.getProfileName())
+    pool.release(manager)
+  
+  def close(self):
+    with self.lock:
+      pools = list(self.pools.values())
+    for pool in pools:
+      pool.close()
+
+def start(*args, **kwargs):
+  pool = TMWebPool(*args, **kwargs)
+  return pool
@@ -0,0 +1,214 @@
+#!/usr/bin/env python3
+
+# Boolean queries on the tags of the files, i.e.
+#   cat and (black or white) and not category:Places
+# The operators are and, or, not (also &, | and - before a name), two names
+# without an operator are joined by and. The names with spaces, parenthesis or
+# quotes are quoted ("New York", "say \"hi\""), category:Name matches the files
+# with any tag of the category and untagged the files without tags.
+
+KEYWORD_AND = 'and'
+KEYWORD_OR = 'or'
+KEYWORD_NOT = 'not'
+KEYWORD_UNTAGGED = 'untagged'
+CATEGORY_PREFIX = 'category:'
+
+# Query tree (tuples, so that the queries can be compared and hashed)
+NODE_TAG = 'tag' # (NODE_TAG, name)
+NODE_CATEGORY = 'category' # (NODE_CATEGORY, name)
+NODE_TAGS = 'tags' # (NODE_TAGS, frozenset of tags codes) any of the tags, see Database.resolveQuery
+NODE_UNTAGGED = 'untagged' # (NODE_UNTAGGED, )
+NODE_NOT = 'not' # (NODE_NOT, node)
+NODE_AND = 'and' # (NODE_AND, (node, ...))
+NODE_OR = 'or' # (NODE_OR, (node, ...))
+
+TOKEN_OPEN = '('
+TOKEN_CLOSE = ')'
+TOKEN_NAME = 'name'
+TOKEN_CATEGORY = 'category'
+
+OPERATORS = {'&': KEYWORD_AND, '|': KEYWORD_OR}
+SEPARATORS = '()&|"'
+
+class QueryError(Exception):
+  pass
+
+###############
+## Tokenizer ##
+###############
+
+def tokenize(text):
+  # Return the tokens of the query as (type, value)
+  tokens = []
+  position = 0
+  while position < len(text):
+    char = text[position]
+    if char.isspace():
+      position += 1
+    elif char in '()':
+      tokens.append((char, None))
+      position += 1
+    elif char in OPERATORS:
+      tokens.append((OPERATORS[char], None))
+      position += 1
+    elif char == '-':
+      tokens.append((KEYWORD_NOT, None))
+      position += 1
+    elif char == '"':
+      name, position = readQuoted(text, position)
+      tokens.append((TOKEN_NAME, name))
+    else:
+      word, position = readWord(text, position)
+      if word.lower() in (KEYWORD_AND, KEYWORD_OR, KEYWORD_NOT, KEYWORD_UNTAGGED):
+        tokens.append((word.lower(), None))
+      elif word.lower().startswith(CATEGORY_PREFIX):
+        name = word[len(CATEGORY_PREFIX):]
+        if name == '' and position < len(text) and text[position] == '"':
+          name, position = readQuoted(text, position)
+        if name == '':
+          raise QueryError('Missing category name')
+        tokens.append((TOKEN_CATEGORY, name))
+      else:
+        tokens.append((TOKEN_NAME, word))
+  return tokens
+
+def readWord(text, position):
+  # NOTE: a - inside a word is part of the name (i.e. sci-fi)
+  end = position
+  while end < len(text) and not text[end].isspace() and not text[end] in SEPARATORS:
+    end += 1
+  return text[position:end], end
+
+def readQuoted(text, position):
+  # Return the string starting at the quote at position and the position after the closing quote
+  chars = []
+  position += 1
+  while position < len(text):
+    char = text[position]
+    if char == '\\' and position + 1 < len(text):
+      chars.append(text[position + 1])
+      position += 2
+    elif char == '"':
+      return ''.join(chars), position + 1
+    else:
+      chars.append(char)
+      position += 1
+  raise QueryError('Missing closing quote')
+
+############
+## Parser ##
+############
+
+class QueryParser():
+  # query := or ; or := and ('or' and)* ; and := not ('and'? not)*
+  # not := 'not' not | '(' or ')' | name | category | 'untagged'
+  
+  def __init__(self, tokens):
+    self.tokens = tokens
+    self.position = 0
+  
+  def peek(self):
+    if self.position < len(self.tokens):
+      return self.tokens[self.position][0]
+    return None
+  
+  def next(self):
+    token = self.tokens[self.position]
+    self.position += 1
+    return token
+  
+  def parse(self):
+    if len(self.tokens) == 0:
+      raise QueryError('Empty query')
+    node = self.parseOr()
+    if self.peek() is not None:
+      raise QueryError('Unexpected ' + self.describe(self.tokens[self.position]))
+    return node
+  
+  def parseOr(self):
+    children = [self.parseAnd()]
+    while self.peek() == KEYWORD_OR:
+      self.next()
+      children.append(self.parseAnd())
+    return joinNodes(NODE_OR, children)
+  
+  def parseAnd(self):
+    children = [self.parseNot()]
+    while self.peek() in (KEYWORD_AND, KEYWORD_NOT, TOKEN_OPEN, TOKEN_NAME, TOKEN_CATEGORY, KEYWORD_UNTAGGED):
+      if self.peek() == KEYWORD_AND:
+        self.next()
+      children.append(self.parseNot())
+    return joinNodes(NODE_AND, children)
+  
+  def parseNot(self):
+    token_type = self.peek()
+    if token_type is None:
+      raise QueryError('Unexpected end of the query')
+    token_type, value = self.next()
+    if token_type == KEYWORD_NOT:
+      child = self.parseNot()
+      if child[0] == NODE_NOT:
+        return child[1]
+      return (NODE_NOT, child)
+    elif token_type == TOKEN_OPEN:
+      node = self.parseOr()
+      if self.peek() != TOKEN_CLOSE:
+        raise QueryError('Missing closing parenthesis')
+      self.next()
+      return node
+    elif token_type == TOKEN_NAME:
+      return (NODE_TAG, value)
+    elif token_type == TOKEN_CATEGORY:
+      return (NODE_CATEGORY, value)
+    elif token_type == KEYWORD_UNTAGGED:
+      return (NODE_UNTAGGED, )
+    raise QueryError('Unexpected ' + self.describe((token_type, value)))
+  
+  def describe(self, token):
+    token_type, value = token
+    if value is None:
+      return "'" + token_type + "'"
+    return "'" + value + "'"
+
+def joinNodes(node_type, children):
+  # Join the children with the operator, the nested ones of the same type are merged
+  nodes = []
+  for child in children:
+    if child[0] == node_type:
+      nodes.extend(child[1])
+    else:
+      nodes.append(child)
+  if len(nodes) == 1:
+    return nodes[0]
+  return (node_type, tuple(nodes))
+
+def parse(text):
+  # Return the query tree of the text, raise QueryError if it is not valid
+  parser = QueryParser(tokenize(text))
+  return parser.parse()
+
+def getNodeNames(node, node_type):
+  # Return the names of the tags (NODE_TAG) or of the categories (NODE_CATEGORY) in the query
+  if node[0] == node_type:
+    return {node[1]}
+  elif node[0] == NODE_NOT:
+    return getNodeNames(node[1], node_type)
+  elif node[0] in (NODE_AND, NODE_OR):
+    names = set()
+    for child in node[1]:
+      names.update(getNodeNames(child, node_type))
+    return names
+  return set()
+
+def getNodeTags(node):
+  # Return the codes of the tags in a resolved query (see Database.resolveQuery)
+  if node[0] == NODE_TAGS:
+    return set(node[1])
+  elif node[0] == NODE_NOT:
+    return getNodeTags(node[1])
+  elif node[0] in (NODE_AND, NODE_OR):
+    codes = set()
+    for child in node[1]:
+      codes.update(getNodeTags(child))
+    return codes
+  return set()
@@ -5,11 +5,13 @@ import os
 import gi
 gi.require_version('Gtk', '3.0')
 from gi.repository import Gtk
+from gi.repository import GLib
 
 from src.Constants import DEBUG
 from src.Utils import PyLog
 from src.Utils import AddFileLayout
 from src.Profile import Profile
+from src import FileWatcher
 
 from src.Interface import Browser
 from src.Interface import TagFile
@@ -23,6 +25,7 @@ class TagSearch(Profile):
     super().__init__(*args, **kwargs)
     self._setupLogger(DEBUG)
     self._initializeVariables()
+    self._startWatcher()
   
   def _initializeVariables(self):
     self.browser = None
@@ -38,6 +41,29 @@ class TagSearch(Profile):
     else:
       self.log = self.logger.createInfoLogger('main.log')
   
+  def _startWatcher(self):
+    self.watcher = None
+    if not self.config['watch_root']:
+      return
+    watcher = FileWatcher.start(self, on_change=self.onFilesChanged, on_overflow=self.onWatcherOverflow)
+    if watcher.start():
+      self.watcher = watcher
+    else:
+      self.log.error("The root folder watcher needs the inotify_simple module")
+  
+  def onFilesChanged(self):
+    # NOTE: called from the watcher thread
+    GLib.idle_add(self._reloadBrowser)
+  
+  def onWatcherOverflow(self):
+    # NOTE: called from the watcher thread
+    self.log.warning("The root folder watcher lost some events, search the missing files")
+  
+  def _reloadBrowser(self):
+    if self.browser is not None:
+      self.browser.reloadMainWindow()
+    return False
+  
   def openBrowser(self):
     self.browser = Browser.open(self)
     self.browser.start()
@@ -46,8 +72,8 @@ class TagSearch(Profile):
     tag_file = TagFile.openFromBrowser(self, paths)
     tag_file.start()
   
-  def openTagFile(self, path):
-    tag_file = TagFile.open(self, [path])
+  def openTagFile(self, paths):
+    tag_file = TagFile.open(self, paths)
     tag_file.start()
   
   def openTagEditor(self):
@@ -72,6 +98,9 @@ class TagSearch(Profile):
     Gtk.main()
   
   def close(self):
+    if self.watcher is not None:
+      self.watcher.stop()
+    self.thumb_manager.close()
     Gtk.main_quit()
   
   def closeSecondary(self, refresh=False):
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+
+from src import TagQuery
+
+# bits set in each byte value, used to read the codes of a bitmap
+BYTE_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+
+################
+## Tags Index ##
+################
+
+class TagsIndex():
+  # In-memory bitmaps of the tagged files: the bit n of the bitmap of a tag is set
+  # if the file with code n has the tag. The bitmaps are python ints, so AND/OR/ANDNOT
+  # and the counts (bit_count) run in C on whole machine words.
+  # NOTE: int.bit_count needs python 3.10
+  # NOTE: changing a single bit copies the bitmap, the bulk methods build
+  #       a mask of all the codes and change the bitmap once
+  
+  def __init__(self):
+    # {tag_code: bitmap}
+    self.tags = {}
+    # bitmap of all the files
+    self.files = 0
+  
+  def load(self, cursor):
+    # Load the bitmaps from the database
+    cursor.execute('SELECT Code FROM Files')
+    self.files = getBitmap(code for (code, ) in cursor)
+    cursor.execute('SELECT Tag, File FROM TagsFiles ORDER BY Tag')
+    tags = {}
+    for tag_code, file_code in cursor:
+      if not tag_code in tags:
+        tags[tag_code] = []
+      tags[tag_code].append(file_code)
+    self.tags = {tag_code: getBitmap(codes) for tag_code, codes in tags.items()}
+  
+  ## Bitmaps
+  def getFilesBitmap(self, tags=()):
+    # Files with all the tags (all the files if there are no tags)
+    tags_codes = set(map(int, tags))
+    if len(tags_codes) == 0:
+      return self.files
+    bitmaps = sorted((self.tags.get(code, 0) for code in tags_codes), key=lambda bitmap : bitmap.bit_length())
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+      if result == 0:
+        break
+      result &= bitmap
+    return result
+  
+  def getTaggedBitmap(self):
+    result = 0
+    for bitmap in self.tags.values():
+      result |= bitmap
+    return result
+  
+  def getUntaggedBitmap(self):
+    return self.files & ~self.getTaggedBitmap()
+  
+  def getQueryBitmap(self, node):
+    # Files matching a resolved query (see Database.resolveQuery)
+    node_type = node[0]
+    if node_type == TagQuery.NODE_TAGS:
+      result = 0
+      for code in node[1]:
+        result |= self.tags.get(code, 0)
+      return result
+    elif node_type == TagQuery.NODE_UNTAGGED:
+      return self.getUntaggedBitmap()
+    elif node_type == TagQuery.NODE_NOT:
+      return self.files & ~self.getQueryBitmap(node[1])
+    bitmaps = [self.getQueryBitmap(child) for child in node[1]]
+    result = bitmaps[0]
+    for bitmap in bitmaps[1:]:
+      if node_type == TagQuery.NODE_AND:
+        result &= bitmap
+      else:
+        result |= bitmap
+    return result
+  
+  ## Counts
+  def getCardinality(self, tags):
+    return {code: self.tags.get(code, 0).bit_count() for code in set(map(int, tags))}
+  
+  def getFacets(self, files_bitmap):
+    # Number of the files of the bitmap with each tag {tag_code: count}
+    counts = {}
+    for tag_code, bitmap in self.tags.items():
+      count = (bitmap & files_bitmap).bit_count()
+      if count > 0:
+        counts[tag_code] = count
+    return counts
+  
+  ## Changes
+  def addFile(self, file_code):
+    self.files |= 1 << file_code
+  
+  def removeFiles(self, files_codes):
+    mask = getBitmap(files_codes)
+    self.files &= ~mask
+    for tag_code in self.tags:
+      self.tags[tag_code] &= ~mask
+  
+  def removeTag(self, tag_code):
+    self.tags.pop(tag_code, None)
+  
+  def addTagToFiles(self, tag_code, files_codes):
+    self.tags[tag_code] = self.tags.get(tag_code, 0) | getBitmap(files_codes)
+  
+  def removeTagFromFiles(self, tag_code, files_codes):
+    if tag_code in self.tags:
+      self.tags[tag_code] &= ~getBitmap(files_codes)
+
+def getBitmap(codes):
+  # Return the bitmap with the bits of the codes set
+  # NOTE: the bits are set in a bytearray, the int is created once
+  bits = bytearray()
+  for code in codes:
+    index = code >> 3
+    if index >= len(bits):
+      bits.extend(bytes(max(index + 1 - len(bits), len(bits))))
+    bits[index] |= 1 << (code & 7)
+  return int.from_bytes(bits, 'little')
+
+def getCodes(bitmap):
+  # Return the codes of the bits set in the bitmap (sorted)
+  codes = []
+  data = bitmap.to_bytes((bitmap.bit_length() + 7) // 8, 'little')
+  for index, value in enumerate(data):
+    if value:
+      base = index << 3
+      codes.extend(base + bit for bit in BYTE_BITS[value])
+  return codes
+
+def start(*args, **kwargs):
+  index = TagsIndex(*args, **kwargs)
+  return index
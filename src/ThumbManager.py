@@ -1,14 +1,17 @@
 #!/usr/bin/env python3
 
 import os
-from subprocess import Popen
+import heapq
+import threading
+import itertools
+import subprocess
 
 try:
   from natsort import natsorted
 except ImportError:
-  def natsorted(data):
+  def natsorted(data, key=None):
     it = list(data)
-    it.sort()
+    it.sort(key=key)
     return it
 
 from src.Utils.Magic import guessMime
@@ -24,25 +27,202 @@ THUMB_FOLDER = 2
 
 RESULT_WORKING = 0
 
+# Lower values are created first
+PRIORITY_VISIBLE = 0
+PRIORITY_DEFAULT = 1000000
+
+#####################
+## Thumb Scheduler ##
+#####################
+
+class ThumbJob():
+  
+  def __init__(self, key, run, priority):
+    self.key = key
+    self.run = run
+    self.priority = priority
+    self.started = False
+    self.callbacks = []
+
+class ThumbScheduler():
+  # Run the thumbnail jobs on at most max_workers threads, one job per key
+  
+  def __init__(self, max_workers):
+    self.max_workers = max(1, max_workers)
+    self.queue = []
+    self.jobs = {}
+    self.workers = 0
+    self.counter = itertools.count()
+    self.condition = threading.Condition()
+    self.stopped = False
+  
+  def setMaxWorkers(self, max_workers):
+    # NOTE: the workers over the limit stop after their current job
+    with self.condition:
+      self.max_workers = max(1, max_workers)
+      self._startWorkers()
+      self.condition.notify_all()
+  
+  def shutdown(self):
+    # Stop the workers after their current job, the queued jobs are dropped
+    with self.condition:
+      self.stopped = True
+      self.queue = []
+      self.jobs = {}
+      self.condition.notify_all()
+  
+  def schedule(self, key, run, priority=PRIORITY_DEFAULT, callback=None):
+    with self.condition:
+      job = self.jobs.get(key)
+      if job is None:
+        job = ThumbJob(key, run, priority)
+        self.jobs[key] = job
+        self._push(job)
+      elif not job.started and priority < job.priority:
+        # NOTE: the old queue entry is skipped when popped
+        job.priority = priority
+        self._push(job)
+      if callback is not None:
+        job.callbacks.append(callback)
+      self._startWorkers()
+  
+  def _push(self, job):
+    heapq.heappush(self.queue, (job.priority, next(self.counter), job))
+    self.condition.notify()
+  
+  def _pop(self):
+    # Return the next job to run, wait if there are none
+    # NOTE: None stops the worker (shutdown or too many workers)
+    with self.condition:
+      while True:
+        if self.stopped or self.workers > self.max_workers:
+          return None
+        if len(self.queue) == 0:
+          self.condition.wait()
+          continue
+        priority, _, job = heapq.heappop(self.queue)
+        if not job.started and priority == job.priority:
+          job.started = True
+          return job
+  
+  def _startWorkers(self):
+    if self.stopped:
+      return None
+    pending = len(self.jobs)
+    while self.workers < self.max_workers and self.workers < pending:
+      self.workers += 1
+      worker = threading.Thread(target=self._work, daemon=True)
+      worker.start()
+  
+  def _work(self):
+    try:
+      while True:
+        job = self._pop()
+        if job is None:
+          break
+        try:
+          result = job.run()
+        except Exception:
+          result = None
+        with self.condition:
+          self.jobs.pop(job.key, None)
+          callbacks = job.callbacks
+        for callback in callbacks:
+          try:
+            callback(result)
+          except Exception:
+            # NOTE: a failing listener must not stop the worker
+            pass
+    finally:
+      with self.condition:
+        self.workers -= 1
+        self._startWorkers()
+
+###################
+## Thumb Manager ##
+###################
+
 class ThumbManager():
 
   def __init__(self, profile):
     self.profile = profile
     self.thumbnails_folder = os.path.join(self.profile.getConfigFolder(), "thumbnails/")
     self.thumbnails_fail_folder = os.path.join(self.profile.getConfigFolder(), "thumbnails_fail/")
+    self.scheduler = ThumbScheduler(self.profile.config['thumb_workers'])
+    self.listeners = []
+    self.listeners_lock = threading.Lock()
+    self.reloadConfig()
+  
+  def reloadConfig(self):
     self.thumb_extension = '.' + self.profile.config['thumb_filetype']
+    self.scheduler.setMaxWorkers(self.profile.config['thumb_workers'])
   
-  def getThumbnail(self, tfile, icon_size):
+  def close(self):
+    self.scheduler.shutdown()
+  
+  def getThumbnail(self, tfile, icon_size, priority=PRIORITY_DEFAULT, callback=None):
+    # NOTE: when the result is RESULT_WORKING the callback is called
+    #       (from a worker thread) with (tfile, icon_size, path) once the
+    #       thumbnail is done, path is None if the creation failed
     path = self.getThumbnailPath(tfile, icon_size)
     fail_path = self.getThumbnailFailPath(tfile, icon_size)
     thumb_type = self.getThumbnailType(tfile)
     if thumb_type is None:
       return None
     elif not os.path.exists(path) and not os.path.exists(fail_path):
-      self.createThumbnail(tfile, path, icon_size, thumb_type=thumb_type)
+      self.scheduleThumbnail(tfile, icon_size, thumb_type, priority, callback)
       return RESULT_WORKING
     else:
       return path
+  
+  ## Listeners
+  def addThumbnailListener(self, listener):
+    # NOTE: the listeners are called (from a worker thread) with
+    #       (tfile, icon_size, path) every time a thumbnail is done,
+    #       path is None if the creation failed
+    with self.listeners_lock:
+      self.listeners.append(listener)
+  
+  def removeThumbnailListener(self, listener):
+    with self.listeners_lock:
+      if listener in self.listeners:
+        self.listeners.remove(listener)
+  
+  def _notifyThumbnailDone(self, tfile, icon_size, path):
+    with self.listeners_lock:
+      listeners = list(self.listeners)
+    for listener in listeners:
+      listener(tfile, icon_size, path)
+  
+  def scheduleThumbnail(self, tfile, icon_size, thumb_type=None, priority=PRIORITY_DEFAULT, callback=None):
+    key = (tfile.getCode(), icon_size)
+    run = lambda : self._runThumbnailJob(tfile, icon_size, thumb_type)
+    if callback is not None:
+      job_callback = lambda path : callback(tfile, icon_size, path)
+    else:
+      job_callback = None
+    self.scheduler.schedule(key, run, priority, job_callback)
+  
+  def _runThumbnailJob(self, tfile, icon_size, thumb_type):
+    path = self.getThumbnailPath(tfile, icon_size)
+    try:
+      created = self.createThumbnail(tfile, path, icon_size, thumb_type=thumb_type)
+    except Exception:
+      created = False
+    if created is False:
+      # remember the failure so that the thumbnail is not created again
+      self._markThumbnailFailed(tfile, icon_size)
+    if not created:
+      path = None
+    self._notifyThumbnailDone(tfile, icon_size, path)
+    return path
+  
+  def _markThumbnailFailed(self, tfile, icon_size):
+    fail_path = self.getThumbnailFailPath(tfile, icon_size)
+    fail_folder = os.path.dirname(fail_path)
+    if not os.path.isdir(fail_folder):
+      os.makedirs(fail_folder, exist_ok=True)
+    open(fail_path, 'w').close()
     
   def getThumbnailPath(self, tfile, icon_size):
     icon_folder = os.path.join(self.thumbnails_folder, str(icon_size))
@@ -53,12 +233,14 @@ class ThumbManager():
     return os.path.join(icon_folder, str(tfile.getCode()) + self.thumb_extension)
   
   def removeThumbnail(self, tfile):
-    thumb_file = self.getThumbnailPath(tfile)
-    thumb_fail_file = self.getThumbnailFailPath(tfile)
-    if os.path.exists(thumb_file):
-      os.remove(thumb_file)
-    if os.path.exists(thumb_fail_file):
-      os.remove(thumb_fail_file)
+    # remove the thumbnails (and the failures) of all the icon sizes
+    for folder in [self.thumbnails_folder, self.thumbnails_fail_folder]:
+      if not os.path.isdir(folder):
+        continue
+      for icon_size in os.listdir(folder):
+        thumb_file = os.path.join(folder, icon_size, str(tfile.getCode()) + self.thumb_extension)
+        if os.path.exists(thumb_file):
+          os.remove(thumb_file)
   
   def getThumbnailType(self, tfile):
     if tfile.getMime() == 'inode/directory':
@@ -70,32 +252,42 @@ class ThumbManager():
     return None
   
   def createThumbnail(self, tfile, thumb_file, icon_size, thumb_type=None):
+    # Return True if the thumbnail was created, False if the creation failed
+    # and None if the file is missing or the thumbnailer can not run
     thumb_folder = os.path.dirname(thumb_file)
     if not os.path.isdir(thumb_folder):
-      os.makedirs(thumb_folder)
+      os.makedirs(thumb_folder, exist_ok=True)
     if not self.profile.fileExists(tfile):
-      return False
+      return None
     else:
       path = self.profile.getFilePath(tfile)
       if thumb_type is None:
         thumb_type = self.getThumbnailType(tfile)
       if thumb_type == THUMB_VIDEO:
-        self.createVideoThumbnail(path, thumb_file, icon_size)
+        return self.createVideoThumbnail(path, thumb_file, icon_size)
       elif thumb_type == THUMB_IMAGE:
-        self.createImageThumbnail(path, thumb_file, icon_size)
+        return self.createImageThumbnail(path, thumb_file, icon_size)
       elif thumb_type == THUMB_FOLDER:
-        self.createFolderThumbnail(path, thumb_file, icon_size)
+        return self.createFolderThumbnail(path, thumb_file, icon_size)
       else:
         return False
   
   def createVideoThumbnail(self, path, thumb_file, icon_size):
     args = ["ffmpegthumbnailer", "-i", path, "-o", thumb_file, "-s", str(icon_size) ]
-    process = Popen(args)
+    return self._runThumbnailer(args, thumb_file)
   
   def createImageThumbnail(self, path, thumb_file, icon_size):
     icon_format = str(icon_size) + "x" + str(icon_size)
     args = ["convert", path + "[0]", "-thumbnail", icon_format, thumb_file]
-    process = Popen(args)
+    return self._runThumbnailer(args, thumb_file)
+  
+  def _runThumbnailer(self, args, thumb_file):
+    try:
+      process = subprocess.run(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    except OSError:
+      # thumbnailer not installed, this is not a failure of the file
+      return None
+    return process.returncode == 0 and os.path.exists(thumb_file)
   
   def createFolderThumbnail(self, path, thumb_file, icon_size):
     fnames = self._getFilesInFolder(path)
@@ -105,12 +297,10 @@ class ThumbManager():
       if not os.path.isdir(fpath):
         mime = guessMime(fpath)
         if mime in VIDEO_MIMES:
-          self.createVideoThumbnail(fpath, thumb_file, icon_size)
-          thumb_created = True
+          thumb_created = self.createVideoThumbnail(fpath, thumb_file, icon_size)
           break
         elif mime in IMAGE_MIMES:
-          self.createImageThumbnail(fpath, thumb_file, icon_size)
-          thumb_created = True
+          thumb_created = self.createImageThumbnail(fpath, thumb_file, icon_size)
           break
     return thumb_created
   
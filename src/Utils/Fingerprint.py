@@ -0,0 +1,27 @@
+#!/usr/bin/env python3
+
+import os
+import hashlib
+
+# NOTE: only the first and the last blocks are hashed, the size is part of the fingerprint
+FINGERPRINT_BLOCK = 64 * 1024
+
+def getFingerprint(path):
+  # Return 'size:hash' or None if the path is not a readable file
+  # NOTE: the empty files have no fingerprint (they would all match)
+  try:
+    with open(path, 'rb') as hand:
+      size = os.fstat(hand.fileno()).st_size
+      if size == 0:
+        return None
+      digest = hashlib.blake2b(digest_size=16)
+      digest.update(hand.read(FINGERPRINT_BLOCK))
+      if size > FINGERPRINT_BLOCK:
+        hand.seek(max(FINGERPRINT_BLOCK, size - FINGERPRINT_BLOCK))
+        digest.update(hand.read(FINGERPRINT_BLOCK))
+  except OSError:
+    return None
+  return str(size) + ':' + digest.hexdigest()
+
+def getFingerprintSize(fingerprint):
+  return int(fingerprint.split(':', 1)[0])
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+
+import threading
+from collections import OrderedDict
+
+## LRUCache: thread safe cache bounded by the total size of the values
+
+class LRUCache():
+
+  def __init__(self, max_size, sizeof=None):
+    self.max_size = max_size
+    if sizeof is None:
+      sizeof = lambda value : 1
+    self.sizeof = sizeof
+    self.items = OrderedDict()
+    self.size = 0
+    self.lock = threading.Lock()
+  
+  def get(self, key, default=None):
+    with self.lock:
+      if not key in self.items:
+        return default
+      self.items.move_to_end(key)
+      return self.items[key][0]
+  
+  def put(self, key, value):
+    size = self.sizeof(value)
+    with self.lock:
+      if key in self.items:
+        self._remove(key)
+      if size > self.max_size:
+        # never fits
+        return None
+      self.items[key] = (value, size)
+      self.size += size
+      self._shrink()
+  
+  def remove(self, key):
+    with self.lock:
+      if key in self.items:
+        self._remove(key)
+  
+  def setMaxSize(self, max_size):
+    with self.lock:
+      self.max_size = max_size
+      self._shrink()
+  
+  def clear(self):
+    with self.lock:
+      self.items.clear()
+      self.size = 0
+  
+  def _remove(self, key):
+    _, size = self.items.pop(key)
+    self.size -= size
+  
+  def _shrink(self):
+    while self.size > self.max_size:
+      _, (_, size) = self.items.popitem(last=False)
+      self.size -= size
+  
+  def __len__(self):
+    return len(self.items)
+  
+  def __contains__(self, key):
+    with self.lock:
+      return key in self.items
+
+def new(*args, **kwargs):
+  cache = LRUCache(*args, **kwargs)
+  return cache
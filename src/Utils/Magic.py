@@ -2,8 +2,33 @@
 
 from mimetypes import guess_extension as guessExtension
 
+import threading
+
 import magic
 
+# NOTE: a libmagic cookie is not thread safe, each thread opens its own
+_magic_local = threading.local()
+
+class MagicCookie():
+  # The cookie of a thread, closed when the thread ends (its local data is deleted)
+  # NOTE: the mime types are guessed on short-lived executor threads too
+  
+  def __init__(self):
+    self.cookie = magic.open(magic.MAGIC_MIME_TYPE)
+    self.cookie.load()
+  
+  def file(self, path):
+    return self.cookie.file(path)
+  
+  def __del__(self):
+    self.cookie.close()
+
+def _getMagicCookie():
+  cookie = getattr(_magic_local, 'cookie', None)
+  if cookie is None:
+    cookie = MagicCookie()
+    _magic_local.cookie = cookie
+  return cookie
+
 def guessMime(path):
-  el = magic.detect_from_filename(path)
-  return el.mime_type
+  return _getMagicCookie().file(path)
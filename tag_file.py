@@ -7,15 +7,15 @@ from src import TagSearch
 from src.Common import getConfigFolder
 
 parser = argparse.ArgumentParser(description='Tag file')
-parser.add_argument('path', help='file to tag')
+parser.add_argument('paths', nargs='+', help='files to tag')
 parser.add_argument('--profile', help='profile to use', default='default')
 args = parser.parse_args()
 
-path = args.path
+paths = args.paths
 profile = args.profile
 
 config_folder = getConfigFolder(profile)
 
 ui = TagSearch.start(config_folder)
-ui.openTagFile(path)
+ui.openTagFile(paths)
 ui.start()
@@ -0,0 +1,47 @@
+#!/usr/bin/env python3
+
+import os
+import tempfile
+import unittest
+
+from src import Database
+
+NAMES = ['Ré_union.png', 'Réunion.png', 'Aé_a.png', 'AÉ_A.png', 'aéxa.png', 'file_1.png', 'FILE_10.jpg', 'file1.png', '100%.png', 'notes.txt']
+TERMS = ['Ré_u', 'ré_u', 'aé_a', 'Aé_a', 'AÉ_', 'é_', 'union', 'UNION', 'file_1', 'FILE', 'file1', '0%.', '%', '_', 'png', 'missing']
+
+#######################
+## Name search tests ##
+#######################
+
+class NameSearchTest(unittest.TestCase):
+  # The name searches with the trigram index must find the files of LOWER(Name) LIKE
+  
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.db = Database.start(os.path.join(self.folder.name, 'tf.db'))
+    self.db.db.execute('INSERT INTO Tags(Code, Name, Category) VALUES (1, ?, 1)', ('tag', ))
+    for code, name in enumerate(NAMES, 1):
+      self.db.db.execute('INSERT INTO Files(Code, Location, Name, Mime) VALUES (?, ?, ?, ?)', (code, 'folder', name, 'image/png'))
+      self.db.db.execute('INSERT INTO TagsFiles(Tag, File, Magnitude) VALUES (1, ?, 1)', (code, ))
+    self.db.commit()
+  
+  def tearDown(self):
+    self.db.close()
+    self.folder.cleanup()
+  
+  def getExpected(self, term):
+    self.db.db.execute('SELECT Code FROM Files WHERE LOWER(Name) LIKE ? ORDER BY Name, Code', ('%' + term + '%', ))
+    return [code for (code, ) in self.db.db.fetchall()]
+  
+  def testNameOnly(self):
+    for term in TERMS:
+      files = self.db.getFilesWithTags([], name_contains=term)
+      self.assertEqual([int(tfile) for tfile in files], self.getExpected(term), term)
+  
+  def testNameWithTags(self):
+    for term in TERMS:
+      files = self.db.getFilesWithTags([1], name_contains=term)
+      self.assertEqual([int(tfile) for tfile in files], self.getExpected(term), term)
+
+if __name__ == '__main__':
+  unittest.main()
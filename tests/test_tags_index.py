@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+import os
+import random
+import tempfile
+import unittest
+
+from src import Database
+from src import TagQuery
+
+FILES_COUNT = 500
+TAGS_COUNT = 20
+
+######################
+## Tags index tests ##
+######################
+
+class TagsIndexTest(unittest.TestCase):
+  # The searches with the tags index must return the same rows of the SQL ones
+  
+  def setUp(self):
+    self.folder = tempfile.TemporaryDirectory()
+    self.db = Database.start(os.path.join(self.folder.name, 'tf.db'))
+    rnd = random.Random(0)
+    tags_codes = list(range(1, TAGS_COUNT + 1))
+    self.db.db.executemany('INSERT INTO Tags(Code, Name, Category) VALUES (?, ?, 1)', [(code, 'tag_' + str(code % 7) + '_' + str(code)) for code in tags_codes])
+    files = []
+    tags_files = []
+    for code in range(1, FILES_COUNT + 1):
+      files.append((code, 'folder_' + str(code % 10), 'file_' + str(code) + '.png', 'image/png'))
+      # NOTE: some files have no tags
+      for tag in set(rnd.choices(tags_codes, k=rnd.randint(0, 5))):
+        tags_files.append((tag, code, rnd.randint(1, 5)))
+    self.db.db.executemany('INSERT INTO Files(Code, Location, Name, Mime) VALUES (?, ?, ?, ?)', files)
+    self.db.db.executemany('INSERT INTO TagsFiles(Tag, File, Magnitude) VALUES (?, ?, ?)', tags_files)
+    self.db.commit()
+  
+  def tearDown(self):
+    self.db.close()
+    self.folder.cleanup()
+  
+  def compare(self, method):
+    # Return the results of the method without and with the tags index
+    self.db.tags_index = None
+    sql_result = method()
+    self.db.loadTagsIndex()
+    index_result = method()
+    self.db.tags_index = None
+    return sql_result, index_result
+  
+  def assertSameFiles(self, method):
+    sql_files, index_files = self.compare(method)
+    self.assertEqual([int(tfile) for tfile in sql_files], [int(tfile) for tfile in index_files])
+    return sql_files
+  
+  def assertSameTags(self, method):
+    sql_tags, index_tags = self.compare(method)
+    self.assertEqual([tag.toArray() for tag in sql_tags], [tag.toArray() for tag in index_tags])
+    return sql_tags
+  
+  def testFilesWithNoTags(self):
+    files = self.assertSameFiles(lambda : self.db.getFilesWithNoTags())
+    self.assertGreater(len(files), 0)
+  
+  def testCommonTags(self):
+    for files in [[1], [1, 2], list(range(1, 50)), list(range(1, FILES_COUNT + 1))]:
+      tags = self.assertSameTags(lambda : self.db.getCommonTags(files))
+      codes = [int(tag) for tag in tags]
+      self.assertEqual(len(codes), len(set(codes)))
+  
+  def testFilesWithTags(self):
+    for tags in [[1], [1, 2], [2, 3, 4]]:
+      self.assertSameFiles(lambda : self.db.getFilesWithTags(tags))
+      self.assertSameFiles(lambda : self.db.getFilesWithTags(tags, name_contains='file_1'))
+  
+  def testQuery(self):
+    query = TagQuery.parse('(tag_1_1 or tag_2_2) and not tag_3_3')
+    self.assertSameFiles(lambda : self.db.getFilesWithTags([], query=query))
+    self.assertSameFiles(lambda : self.db.getFilesWithTags([4], query=TagQuery.parse('untagged or tag_5_5')))
+  
+  def testTagsFacets(self):
+    for tags in [[], [1], [1, 2]]:
+      (sql_counts, sql_tags), (index_counts, index_tags) = self.compare(lambda : self.db.getTagsFacets(tags))
+      self.assertEqual(sql_counts, index_counts)
+      self.assertEqual([tag.toArray() for tag in sql_tags], [tag.toArray() for tag in index_tags])
+  
+  def testTagsCardinality(self):
+    sql_cardinality, index_cardinality = self.compare(lambda : self.db.getTagsCardinality(range(1, TAGS_COUNT + 1)))
+    self.assertEqual(sql_cardinality, index_cardinality)
+
+if __name__ == '__main__':
+  unittest.main()
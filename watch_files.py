@@ -0,0 +1,25 @@
+#!/usr/bin/env python3
+
+import argparse
+
+from src import Profile
+from src import FileWatcher
+from src.Common import getConfigFolder
+
+parser = argparse.ArgumentParser(description='Keep the database in sync with the files moved or deleted under the root folder')
+parser.add_argument('--profile', help='profile to use', default='default')
+args = parser.parse_args()
+
+config_folder = getConfigFolder(args.profile)
+profile = Profile.start(config_folder)
+watcher = FileWatcher.start(profile, on_change=lambda : print('Database updated'), on_overflow=lambda : print('Some events were lost, search the missing files'))
+if not watcher.start():
+  print('The watcher needs the inotify_simple module')
+  exit(1)
+print('Watching ' + profile.config['root'])
+try:
+  watcher.join()
+except KeyboardInterrupt:
+  watcher.stop()
+  watcher.join()
+profile.close()